@@ -0,0 +1,228 @@
+""" Synthetic large-campaign generator.
+
+Builds a database with the real migrations, and fills campaign 1 with a large, randomly generated but reproducible
+campaign: users, characters, factions with dense memberships, places in regions and dungeons, things owned and
+carried by characters, and chronicle entries linked to them, with rich description files for everything that has one.
+Every user's password is "password", and the first user is the campaign's master.
+
+    python -m bench.generate PATH [--users 50] [--characters 10000] [--factions 2000] [--places 1000] [--things 5000]
+        [--chronicle 100000] [--memberships 8] [--description-bytes 1024] [--seed 1] [--no-index]
+
+PATH is created if needed, and holds db.sqlite, the rich description files, and a generate.json describing what was
+generated.
+"""
+from tests.support import MIGRATION_DIR
+from src.lore_log.db import Database, OrderedMigration
+from src.lore_log.fts import index_missing
+from src.lore_log.search import searchable_models
+import argparse
+import random
+import bcrypt
+import json
+import time
+import sys
+import os
+
+CAMPAIGN_ID = 1
+WORDS = ("ancient", "amber", "ash", "banner", "blade", "bone", "crown", "crystal", "dawn", "deep", "dragon", "dusk",
+         "ember", "fallen", "frost", "gate", "gilded", "grave", "hollow", "iron", "ivory", "keep", "lantern", "lost",
+         "moon", "oath", "raven", "river", "rune", "salt", "shadow", "silver", "stone", "storm", "thorn", "tide",
+         "tower", "veil", "whisper", "wild", "wolf", "wyrm")
+RACES = ("human", "elf", "dwarf", "halfling", "gnome", "half-orc", "tiefling", "dragonborn")
+CLASSES = ("fighter", "wizard", "rogue", "cleric", "ranger", "bard", "paladin", "druid", "warlock", "monk")
+ALIGNMENTS = ("LG", "NG", "CG", "LN", "N", "CN", "LE", "NE", "CE")
+PLACE_TYPES = ("region", "city", "dungeon")
+THING_TYPES = ("weapon", "armour", "potion", "scroll", "trinket", "tool")
+ROLES = ("member", "agent", "leader", "informant", "recruit")
+# Weights of the entity types chronicle entries are about
+RELATION_TYPES = (("character", 5), ("faction", 2), ("place", 2), ("thing", 1))
+
+
+class Generator:
+
+    def __init__(self, path: str, seed: int = 1, description_bytes: int = 1024):
+        self.path = path
+        self.rng = random.Random(seed)
+        self.description_bytes = description_bytes
+
+    def id(self) -> str:
+        return "%032x" % self.rng.getrandbits(128)
+
+    def words(self, count: int) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(count))
+
+    def rich_description(self) -> str:
+        """ Writes a new rich description file of about `description_bytes`, returning its name """
+        paragraphs = []
+        size = 0
+        while size < self.description_bytes:
+            paragraph = "<p>" + self.words(self.rng.randint(10, 40)).capitalize() + ".</p>"
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+        file_name = self.id()
+        with open(os.path.join(self.path, file_name), "w") as f:
+            f.write("".join(paragraphs))
+        return file_name
+
+    def users(self, count: int) -> list:
+        # Hashed once, as hashing is deliberately slow and every user shares the same password
+        password = bcrypt.hashpw(b"password", bcrypt.gensalt(4))
+        return [(self.id(), f"user{i}@example.com", password, f"user{i}") for i in range(count)]
+
+    def characters(self, count: int, users: list) -> list:
+        rows = []
+        for i in range(1, count + 1):
+            rows.append((i, f"{self.words(2).title()} {i}", self.rng.choice(RACES), self.rng.randint(1, 20),
+                         self.rng.choice(CLASSES), self.rng.randint(1, 20), self.rng.choice(ALIGNMENTS),
+                         *(self.rng.randint(3, 18) for _ in range(6)),
+                         int(self.rng.random() < 0.5), int(self.rng.random() < 0.8), int(self.rng.random() < 0.05),
+                         self.rng.choice(users)[0], CAMPAIGN_ID, self.words(12)))
+        return rows
+
+    def named(self, count: int, users: list, extra) -> list:
+        """ Rows of (id, name, description, external_file_name, is_public, campaign_id, creator_id) + extra(i) """
+        return [(i, f"{self.words(2).title()} {i}", self.words(12), self.rich_description(),
+                 int(self.rng.random() < 0.8), CAMPAIGN_ID, self.rng.choice(users)[0]) + extra(i)
+                for i in range(1, count + 1)]
+
+    def memberships(self, characters: list, factions: int, average: int) -> list:
+        rows = []
+        for character in characters:
+            for faction_id in self.rng.sample(range(1, factions + 1), min(factions, self.rng.randint(0, average * 2))):
+                rows.append((character[0], faction_id, int(self.rng.random() < 0.7), self.rng.choice(ROLES),
+                             str(self.rng.randint(-10, 10)), character[16]))
+        return rows
+
+    def places(self, place_rows: list) -> tuple:
+        """ Puts every city in a region, and some places in each dungeon, as (region_city, dungeon_place) rows """
+        by_type = {place_type: [row[0] for row in place_rows if row[7] == place_type] for place_type in PLACE_TYPES}
+        cities = [(self.rng.choice(by_type["region"]), city, "") for city in by_type["city"] if by_type["region"]]
+        ids = [row[0] for row in place_rows]
+        dungeons = [(dungeon, place, "") for dungeon in by_type["dungeon"]
+                    for place in self.rng.sample(ids, min(len(ids), self.rng.randint(0, 3))) if place != dungeon]
+        return cities, dungeons
+
+    def inventory(self, characters: int, things: int, average: int = 2) -> list:
+        rows = []
+        for character_id in range(1, characters + 1):
+            for thing_id in self.rng.sample(range(1, things + 1), min(things, self.rng.randint(0, average * 2))):
+                rows.append((character_id, thing_id, self.rng.randint(1, 3), int(self.rng.random() < 0.7)))
+        return rows
+
+    def chronicle(self, count: int, users: list, entities: dict) -> tuple:
+        types = [name for name, weight in RELATION_TYPES for _ in range(weight) if entities[name]]
+        entries = []
+        links = []
+        for i in range(count):
+            relation_type = self.rng.choice(types)
+            entry_id = self.id()
+            tick = 1000 + i * 10
+            entries.append((entry_id, self.words(4).capitalize(), tick, self.rich_description(),
+                            relation_type, CAMPAIGN_ID, self.rng.choice(users)[0], int(self.rng.random() < 0.8)))
+            links.append((relation_type, self.rng.randint(1, entities[relation_type]), tick, entry_id))
+        return entries, links
+
+
+def generate(path: str, users: int = 50, characters: int = 10000, factions: int = 2000, places: int = 1000,
+             things: int = 5000, chronicle: int = 100000, memberships: int = 8, description_bytes: int = 1024,
+             seed: int = 1, index: bool = True) -> dict:
+    """ Generates a campaign into `path`, returning the number of rows of each table, as also saved in generate.json """
+    os.makedirs(path, exist_ok=True)
+    start = time.monotonic()
+    db = Database(os.path.join(path, "db.sqlite"))
+    OrderedMigration(MIGRATION_DIR, db.connection())()
+    gen = Generator(path, seed, description_bytes)
+
+    user_rows = gen.users(users)
+    character_rows = gen.characters(characters, user_rows)
+    faction_rows = gen.named(factions, user_rows, lambda i: ())
+    place_rows = gen.named(places, user_rows, lambda i: (gen.rng.choice(PLACE_TYPES),))
+    thing_rows = gen.named(things, user_rows, lambda i: (
+        gen.rng.choice(THING_TYPES), gen.rng.randint(1, 100), gen.rng.randint(1, 1000), "gp",
+        gen.rng.randint(1, characters) if characters and gen.rng.random() < 0.5 else None))
+    membership_rows = gen.memberships(character_rows, factions, memberships)
+    entry_rows, link_rows = gen.chronicle(chronicle, user_rows, {
+        "character": characters, "faction": factions, "place": places, "thing": things})
+    # Generated last, so that adding them left every row above as it was for the same seed
+    region_city_rows, dungeon_place_rows = gen.places(place_rows)
+    inventory_rows = gen.inventory(characters, things)
+
+    with db.transaction() as conn:
+        conn.executemany("INSERT INTO [user] ([id], [email], [password], [alias]) VALUES (?, ?, ?, ?)", user_rows)
+        conn.executemany("INSERT INTO [profile] ([user_id]) VALUES (?)", [(row[0],) for row in user_rows])
+        conn.executemany("INSERT INTO [user_campaign_map] ([user_id], [campaign_id], [is_master]) VALUES (?, ?, ?)",
+                         [(row[0], CAMPAIGN_ID, int(i == 0)) for i, row in enumerate(user_rows)])
+        conn.executemany("""
+        INSERT INTO [character] ([id], [name], [race], [level], [primary_class], [primary_class_level], [alignment],
+            [attr_str_1], [attr_dex_2], [attr_con_3], [attr_int_4], [attr_wis_5], [attr_cha_6], [attributes_public],
+            [is_public], [is_pc], [creator_id], [campaign_id], [description])
+        VALUES ({})""".format(",".join(["?"] * 19)), character_rows)
+        conn.executemany("""
+        INSERT INTO [faction] ([id], [name], [description], [external_file_name], [is_public], [campaign_id],
+            [creator_id])
+        VALUES (?, ?, ?, ?, ?, ?, ?)""", faction_rows)
+        conn.executemany("""
+        INSERT INTO [place] ([id], [name], [description], [external_file_name], [is_public], [campaign_id],
+            [creator_id], [type])
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", place_rows)
+        conn.executemany("""
+        INSERT INTO [thing] ([id], [name], [description], [external_file_name], [is_public], [campaign_id],
+            [creator_id], [type], [weight], [price], [price_unit], [owner_id])
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", thing_rows)
+        conn.executemany("""
+        INSERT INTO [character_faction] ([character_id], [faction_id], [is_public], [role], [reputation], [creator_id])
+        VALUES (?, ?, ?, ?, ?, ?)""", membership_rows)
+        conn.executemany("INSERT INTO [region_city] ([region_id], [city_id], [remark]) VALUES (?, ?, ?)",
+                         region_city_rows)
+        conn.executemany("INSERT INTO [dungeon_place] ([dungeon_id], [place_id], [remark]) VALUES (?, ?, ?)",
+                         dungeon_place_rows)
+        conn.executemany("INSERT INTO [inventory] ([character_id], [thing_id], [quantity], [is_public]) "
+                         "VALUES (?, ?, ?, ?)", inventory_rows)
+        conn.executemany("""
+        INSERT INTO [chronicle_entry] ([id], [title], [tick], [external_file_name], [relation_type], [campaign_id],
+            [creator_id], [is_public])
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", entry_rows)
+        conn.executemany("""
+        INSERT INTO [entity_chronicle] ([entity_type], [entity_id], [tick], [chronicle_entry_id]) VALUES (?, ?, ?, ?)
+        """, link_rows)
+        if index:
+            index_missing(conn, path, searchable_models, CAMPAIGN_ID)
+
+    counts = {"user": len(user_rows), "character": len(character_rows), "faction": len(faction_rows),
+              "place": len(place_rows), "thing": len(thing_rows), "character_faction": len(membership_rows),
+              "region_city": len(region_city_rows), "dungeon_place": len(dungeon_place_rows),
+              "inventory": len(inventory_rows), "chronicle_entry": len(entry_rows),
+              "entity_chronicle": len(link_rows)}
+    summary = {"seed": seed, "description_bytes": description_bytes, "indexed": index, "rows": counts,
+               "master": {"id": user_rows[0][0], "email": user_rows[0][1], "password": "password"},
+               "seconds": round(time.monotonic() - start, 1)}
+    with open(os.path.join(path, "generate.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--characters", type=int, default=10000)
+    parser.add_argument("--factions", type=int, default=2000)
+    parser.add_argument("--places", type=int, default=1000)
+    parser.add_argument("--things", type=int, default=5000)
+    parser.add_argument("--chronicle", type=int, default=100000)
+    parser.add_argument("--memberships", type=int, default=8, help="average factions per character")
+    parser.add_argument("--description-bytes", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-index", action="store_true", help="skip building the full text search index")
+    args = parser.parse_args()
+    if os.path.exists(os.path.join(args.path, "db.sqlite")):
+        print(f"{args.path} already has a database", file=sys.stderr)
+        return 1
+    summary = generate(args.path, args.users, args.characters, args.factions, args.places, args.things, args.chronicle,
+                       args.memberships, args.description_bytes, args.seed, not args.no_index)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
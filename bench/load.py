@@ -0,0 +1,260 @@
+""" Load benchmark.
+
+Drives the API in-process through falcon.testing, against a campaign from bench.generate, one endpoint at a time.
+Prints the throughput and latency percentiles of each endpoint as JSON, so that runs on different commits can be
+compared. With --processes, that many forked processes (each with --threads threads) drive every endpoint at once.
+
+    python -m bench.load [--data PATH] [--scale 0.1] [--seconds 3] [--threads 1] [--processes 1] [--read-only]
+        [--only NAME] [--no-response-cache] [--output FILE]
+
+Without --data, a campaign is generated into a temporary directory at --scale times bench.generate's defaults. The
+write endpoints add rows to the database they are given, so point --data at a copy to keep the original unchanged.
+"""
+from bench.generate import generate, CAMPAIGN_ID, WORDS
+from bench.login import percentile
+from src.lore_log import API
+from src.lore_log.db import Database, OrderedMigration
+from tests.support import MIGRATION_DIR
+from contextlib import redirect_stdout
+from falcon import testing
+import multiprocessing
+import subprocess
+import threading
+import itertools
+import argparse
+import tempfile
+import random
+import json
+import time
+import sys
+import os
+
+
+class Endpoint:
+    """ One kind of request. `request` builds each one from a random generator, as a path, or a (path, body) pair """
+
+    def __init__(self, name: str, request, method: str = "get", write: bool = False):
+        self.name = name
+        self.request = request
+        self.method = method
+        self.write = write
+
+    def call(self, client: testing.TestClient, headers: dict, rng: random.Random):
+        request = self.request(rng)
+        path, body = request if isinstance(request, tuple) else (request, None)
+        kwargs = {"json": body} if body is not None else {}
+        return getattr(client, "simulate_" + self.method)(path, headers=headers, **kwargs)
+
+
+def endpoints(db: Database, user_id: str, client: testing.TestClient, headers: dict) -> list:
+    """ The requests to benchmark, picking ids from what the campaign actually holds """
+    conn = db.read_connection()
+
+    def ids(sql, *args):
+        return [row[0] for row in conn.execute(sql, args)] or [0]
+
+    visible = "WHERE [campaign_id] = ? AND ([is_public] = 1 OR [creator_id] = ?)"
+    characters = ids(f"SELECT [id] FROM [character] {visible}", CAMPAIGN_ID, user_id)
+    factions = ids(f"SELECT [id] FROM [faction] {visible}", CAMPAIGN_ID, user_id)
+    places = ids(f"SELECT [id] FROM [place] {visible}", CAMPAIGN_ID, user_id)
+    things = ids(f"SELECT [id] FROM [thing] {visible}", CAMPAIGN_ID, user_id)
+    entries = ids(f"SELECT [id] FROM [chronicle_entry] {visible} LIMIT 10000", CAMPAIGN_ID, user_id)
+    own_factions = [{"id": row[0], "name": row[1], "is_public": row[2]} for row in conn.execute(
+        "SELECT [id], [name], [is_public] FROM [faction] WHERE [campaign_id] = ? AND [creator_id] = ?",
+        (CAMPAIGN_ID, user_id))]
+    own_characters = ids("SELECT [id] FROM [character] WHERE [campaign_id] = ? AND [creator_id] = ?",
+                         CAMPAIGN_ID, user_id)
+    cursors = {path: client.simulate_get(path + "?limit=50", headers=headers).headers.get("x-next-cursor", "")
+               for path in ("/characters", "/chronicle")}
+    # A sync that is a thousand changes behind
+    since = max(0, conn.execute("SELECT [version] FROM [change_seq] WHERE [id] = 1").fetchone()[0] - 1000)
+    # Unique across processes and runs, for the names of created rows
+    names = itertools.count()
+    prefix = f"{os.getpid()}-{time.time_ns()}"
+
+    def rich_description(rng):
+        return "<p>" + " ".join(rng.choice(WORDS) for _ in range(50)) + "</p>"
+
+    def new_thing(rng):
+        return "/things", {"name": f"Load {prefix}-{next(names)}", "type": "trinket", "is_public": 1,
+                           "rich_description": rich_description(rng)}
+
+    def new_entry(rng):
+        return "/chronicle", {"title": "Load", "relation_type": "character", "relation_id": rng.choice(own_characters),
+                              "is_public": 1, "rich_description": rich_description(rng)}
+
+    def faction_edit(rng):
+        faction = dict(rng.choice(own_factions), rich_description=rich_description(rng))
+        return f"/factions/{faction['id']}", faction
+
+    result = [
+        Endpoint("GET /characters?limit=50", lambda rng: "/characters?limit=50"),
+        Endpoint("GET /characters?limit=50&cursor",
+                 lambda rng: "/characters?limit=50&cursor=" + cursors["/characters"]),
+        Endpoint("GET /characters?fields=id,name", lambda rng: "/characters?fields=id,name&stream=0"),
+        Endpoint("GET /characters/{id}", lambda rng: f"/characters/{rng.choice(characters)}"),
+        Endpoint("GET /characters/{id}/relations/factions",
+                 lambda rng: f"/characters/{rng.choice(characters)}/relations/factions"),
+        Endpoint("GET /factions?limit=50", lambda rng: "/factions?limit=50"),
+        Endpoint("GET /factions/{id}", lambda rng: f"/factions/{rng.choice(factions)}"),
+        Endpoint("GET /factions/{id}/relations/characters",
+                 lambda rng: f"/factions/{rng.choice(factions)}/relations/characters"),
+        Endpoint("GET /places?limit=50", lambda rng: "/places?limit=50"),
+        Endpoint("GET /places/{id}", lambda rng: f"/places/{rng.choice(places)}"),
+        Endpoint("GET /things?limit=50", lambda rng: "/things?limit=50"),
+        Endpoint("GET /things/{id}", lambda rng: f"/things/{rng.choice(things)}"),
+        Endpoint("GET /chronicle?limit=50", lambda rng: "/chronicle?limit=50"),
+        Endpoint("GET /chronicle?limit=50&cursor", lambda rng: "/chronicle?limit=50&cursor=" + cursors["/chronicle"]),
+        Endpoint("GET /chronicle?relation_type=character",
+                 lambda rng: f"/chronicle?relation_type=character&relation_id={rng.choice(characters)}&limit=50"),
+        Endpoint("GET /chronicle?relation_type=character&include=factions&from_tick",
+                 lambda rng: f"/chronicle?relation_type=character&relation_id={rng.choice(characters)}"
+                             "&include=factions&from_tick=100000&to_tick=600000&limit=50"),
+        Endpoint("GET /chronicle/{id}", lambda rng: f"/chronicle/{rng.choice(entries)}"),
+        Endpoint("GET /graph?root=character", lambda rng: f"/graph?root=character:{rng.choice(characters)}"),
+        Endpoint("GET /graph?root=faction&depth=1", lambda rng: f"/graph?root=faction:{rng.choice(factions)}&depth=1"),
+        Endpoint("GET /search", lambda rng: f"/search?q={rng.choice(WORDS)}+{rng.choice(WORDS)[:3]}"),
+        Endpoint("GET /changes?since", lambda rng: f"/changes?since={since}"),
+        Endpoint("POST /things", new_thing, "post", write=True),
+        Endpoint("POST /chronicle", new_entry, "post", write=True),
+    ]
+    if own_factions:
+        result.append(Endpoint("PATCH /factions/{id}", faction_edit, "patch", write=True))
+    return result
+
+
+def run(data: str, seconds: float, threads: int, read_only: bool, only: str = None, cache: bool = True, barrier=None,
+        queue=None):
+    """ Runs every endpoint for `seconds` on `threads` threads, returning {name: (latencies, errors, elapsed)} """
+    db = Database(os.path.join(data, "db.sqlite"))
+    with open(os.path.join(data, "generate.json")) as f:
+        master = json.load(f)["master"]
+    client = testing.TestClient(API(db, data) if cache else API(db, data, response_cache_bytes=0))
+    login = client.simulate_post("/login", json={"email": master["email"], "password": master["password"]})
+    headers = {"Authorization": "jwt " + login.json["jwt"]}
+    results = {}
+    for endpoint in endpoints(db, master["id"], client, headers):
+        if (read_only and endpoint.write) or (only and only not in endpoint.name):
+            continue
+        if barrier is not None:
+            barrier.wait()
+        latencies, errors = [], []
+        stop = time.monotonic() + seconds
+
+        def loop(seed):
+            rng = random.Random(seed)
+            while time.monotonic() < stop:
+                start = time.perf_counter()
+                try:
+                    result = endpoint.call(client, headers, rng)
+                except Exception as e:
+                    # Unhandled errors propagate through the test client, rather than becoming a 500
+                    errors.append(f"{type(e).__name__}: {e}")
+                    continue
+                elapsed = time.perf_counter() - start
+                if result.status_code >= 400:
+                    errors.append(result.status)
+                else:
+                    latencies.append(elapsed)
+
+        start = time.monotonic()
+        workers = [threading.Thread(target=loop, args=(os.getpid() * 1000 + i,)) for i in range(threads)]
+        for each in workers:
+            each.start()
+        for each in workers:
+            each.join()
+        results[endpoint.name] = (latencies, errors, time.monotonic() - start)
+    if queue is not None:
+        queue.put(results)
+    return results
+
+
+def summarize(runs: list) -> dict:
+    """ Combines the results of every process into throughput and latency percentiles for each endpoint """
+    summary = {}
+    for name in runs[0]:
+        latencies = [each for run in runs for each in run[name][0]]
+        errors = [each for run in runs for each in run[name][1]]
+        elapsed = max(run[name][2] for run in runs)
+        summary[name] = {
+            "requests": len(latencies),
+            "errors": len(errors),
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.5), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+        }
+        if errors:
+            summary[name]["first_error"] = errors[0]
+    return summary
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.realpath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", help="a directory written by bench.generate")
+    parser.add_argument("--scale", type=float, default=0.1, help="of bench.generate's defaults, without --data")
+    parser.add_argument("--seconds", type=float, default=3, help="per endpoint")
+    parser.add_argument("--threads", type=int, default=1, help="per process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--read-only", action="store_true", help="skip the endpoints that write")
+    parser.add_argument("--only", help="only run endpoints whose name contains this")
+    parser.add_argument("--no-response-cache", action="store_true", help="measure every request doing its own work")
+    parser.add_argument("--output", help="write the JSON here rather than to stdout")
+    args = parser.parse_args()
+
+    data = args.data
+    # Migrations report progress on stdout, where the results go
+    with redirect_stdout(sys.stderr):
+        if data is None:
+            data = tempfile.mkdtemp()
+            scale = args.scale
+            generate(data, users=50, characters=int(10000 * scale), factions=int(2000 * scale),
+                     places=int(1000 * scale), things=int(5000 * scale), chronicle=int(100000 * scale))
+        else:
+            # Brings a campaign generated on an older commit up to this one's schema
+            OrderedMigration(MIGRATION_DIR, Database(os.path.join(data, "db.sqlite")).connection())()
+    with open(os.path.join(data, "generate.json")) as f:
+        generated = json.load(f)
+
+    if args.processes == 1:
+        runs = [run(data, args.seconds, args.threads, args.read_only, args.only, not args.no_response_cache)]
+    else:
+        context = multiprocessing.get_context("fork")
+        barrier = context.Barrier(args.processes)
+        queue = context.Queue()
+        processes = [context.Process(target=run, args=(data, args.seconds, args.threads, args.read_only, args.only,
+                                                       not args.no_response_cache, barrier, queue))
+                     for _ in range(args.processes)]
+        for each in processes:
+            each.start()
+        runs = [queue.get() for _ in processes]
+        for each in processes:
+            each.join()
+
+    report = {
+        "commit": commit(),
+        "python": sys.version.split()[0],
+        "processes": args.processes,
+        "threads": args.threads,
+        "seconds": args.seconds,
+        "rows": generated["rows"],
+        "endpoints": summarize(runs),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
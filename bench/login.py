@@ -0,0 +1,101 @@
+""" Login throughput benchmark.
+
+Measures GET latency on its own, then again while other threads log in continuously, along with the latency of the
+logins themselves and how many were turned away because the password hashing pool was saturated.
+
+    python -m bench.login [--rounds 12] [--workers 2] [--max-queue 16] [--logins 4] [--seconds 5]
+"""
+from tests.support import MIGRATION_DIR
+from src.lore_log import API
+from src.lore_log.db import Database, OrderedMigration
+from falcon import testing
+import argparse
+import threading
+import tempfile
+import bcrypt
+import time
+import sys
+import os
+
+
+def seed(db: Database, rounds: int):
+    conn = db.connection()
+    conn.execute("INSERT INTO [user] ([id], [email], [password], [alias]) VALUES ('u1', 'one@example.com', ?, 'u1')",
+                 (bcrypt.hashpw(b"password", bcrypt.gensalt(rounds)),))
+    conn.execute("INSERT INTO [profile] ([user_id]) VALUES ('u1')")
+    conn.execute("INSERT INTO [user_campaign_map] ([user_id], [campaign_id], [is_master]) VALUES ('u1', 1, 1)")
+    conn.commit()
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else float("nan")
+
+
+def report(name: str, latencies: list):
+    print(f"{name:<28} n={len(latencies):<6} p50={percentile(latencies, 0.5):8.2f}ms "
+          f"p99={percentile(latencies, 0.99):8.2f}ms")
+
+
+def run(client: testing.TestClient, headers: dict, logins: int, seconds: float):
+    """ Runs one thread of GETs, and `logins` threads logging in, until `seconds` have passed """
+    stop = time.monotonic() + seconds
+    gets, login_latencies, rejected = [], [], []
+
+    def get_loop():
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            client.simulate_get("/things", headers=headers)
+            gets.append(time.perf_counter() - start)
+
+    def login_loop():
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            result = client.simulate_post("/login", json={"email": "one@example.com", "password": "password"})
+            if result.status_code == 503:
+                rejected.append(1)
+            else:
+                login_latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=get_loop)] + [threading.Thread(target=login_loop) for _ in range(logins)]
+    for each in threads:
+        each.start()
+    for each in threads:
+        each.join()
+    return gets, login_latencies, len(rejected)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-queue", type=int, default=16)
+    parser.add_argument("--logins", type=int, default=4, help="threads logging in concurrently")
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    db = Database(os.path.join(path, "db.sqlite"))
+    OrderedMigration(MIGRATION_DIR, db.connection())()
+    seed(db, args.rounds)
+    api = API(db, path, bcrypt_rounds=args.rounds, bcrypt_workers=args.workers, bcrypt_max_queue=args.max_queue)
+    client = testing.TestClient(api)
+    jwt = client.simulate_post("/login", json={"email": "one@example.com", "password": "password"}).json["jwt"]
+    headers = {"Authorization": "jwt " + jwt}
+    for i in range(20):
+        client.simulate_post("/things", headers=headers, json={"name": f"thing {i}", "type": "junk", "is_public": 1})
+
+    print(f"bcrypt rounds={args.rounds} workers={args.workers} max_queue={args.max_queue} "
+          f"login threads={args.logins}, {args.seconds}s per phase")
+    gets, _, _ = run(client, headers, 0, args.seconds)
+    report("GET /things, idle", gets)
+    gets, logins, rejected = run(client, headers, args.logins, args.seconds)
+    report("GET /things, during logins", gets)
+    report("POST /login", logins)
+    print(f"{'logins rejected (503)':<28} {rejected}")
+    api.password_hasher.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+""" Metrics overhead microbenchmark.
+
+Times what recording metrics adds to each request: the middleware's bookkeeping for one request, and the counting and
+timing added to each SQL statement by TimedConnection.
+
+    python -m bench.metrics [iterations]
+"""
+from src.lore_log.metrics import Metrics, MetricsMiddleware, TimedConnection
+from falcon import testing
+import falcon
+import sqlite3
+import timeit
+import sys
+
+
+def best(statement, number: int, repeat: int = 5) -> float:
+    """ The best time of `repeat` runs, per call, in microseconds """
+    return min(timeit.repeat(statement, number=number, repeat=repeat)) / number * 1e6
+
+
+def main() -> int:
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    middleware = MetricsMiddleware(Metrics())
+    req = falcon.Request(testing.create_environ("/things/1"))
+    req.uri_template = "/things/{thing_id}"
+    res = falcon.Response()
+    res.body = "{}"
+
+    def request():
+        middleware.process_request(req, res)
+        middleware.process_response(req, res, None, True)
+
+    plain = sqlite3.connect(":memory:")
+    timed = sqlite3.connect(":memory:", factory=TimedConnection)
+    results = {
+        "middleware, per request": best(request, number),
+        "SELECT 1, plain connection": best(lambda: plain.execute("SELECT 1").fetchone(), number),
+        "SELECT 1, timed connection": best(lambda: timed.execute("SELECT 1").fetchone(), number),
+    }
+    print(f"{number} iterations, best of 5, in µs per call")
+    for name, micros in results.items():
+        print(f"{name:<28} {micros:8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+""" Model hydration microbenchmark.
+
+Times building models from db rows, and turning them back into summary and full dicts, as list and detail endpoints do
+for every row they return.
+
+    python -m bench.models [rows]
+"""
+from src.lore_log.characters import CharacterModel
+from src.lore_log.things import ThingModel
+import timeit
+import sys
+
+
+def rows_for(model, count: int) -> list:
+    return [tuple(f"{field}-{i}" for field in model.fields) for i in range(count)]
+
+
+def best(statement, repeat: int = 5) -> float:
+    return min(timeit.repeat(statement, number=1, repeat=repeat))
+
+
+def main() -> int:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print(f"{count} rows, best of 5, in ms")
+    for model in (ThingModel, CharacterModel):
+        rows = rows_for(model, count)
+        models = [model.from_db(row) for row in rows]
+        results = {
+            "from_db": best(lambda: [model.from_db(row) for row in rows]),
+            "to_summary_dict": best(lambda: [each.to_summary_dict() for each in models]),
+            "from_db + to_summary_dict": best(lambda: [model.from_db(row).to_summary_dict() for row in rows]),
+            "from_db + to_dict": best(lambda: [model.from_db(row).to_dict() for row in rows]),
+            "attribute reads": best(lambda: [(each.name, each.campaign_id, each.creator_id) for each in models]),
+        }
+        for name, seconds in results.items():
+            print(f"{model.__name__:>16} {name:<26} {seconds * 1000:8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
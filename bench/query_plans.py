@@ -0,0 +1,26 @@
+""" Query plan regression check.
+
+Runs the check of tests/test_query_plans.py, and prints every statement that reads a table with a full scan instead
+of an index. Exits non-zero if there are any.
+
+    python -m bench.query_plans
+"""
+from tests.test_query_plans import planned_statements, full_scans
+import tempfile
+import sys
+
+
+def main() -> int:
+    statements, conn = planned_statements(tempfile.mkdtemp())
+    failures = 0
+    for sql in statements:
+        scans = full_scans(conn, sql)
+        if scans:
+            failures += 1
+            print("FULL SCAN ({}):\n    {}\n".format("; ".join(scans), " ".join(sql.split())))
+    print(f"{len(statements)} statements checked, {failures} with full table scans")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+-- One index of what every chronicle entry is about, replacing the four {type}_chronicle link tables. Keyed by entity
+-- then tick, so an entity's timeline, or any range of ticks of it, is a single range scan in the order it is listed.
+-- [tick] is a copy of the entry's, kept in step by the trigger below.
+CREATE TABLE [entity_chronicle] (
+    [entity_type] VARCHAR(16) NOT NULL,
+    [entity_id] INTEGER NOT NULL,
+    [tick] INTEGER NOT NULL,
+    [chronicle_entry_id] CHAR(32) NOT NULL,
+    CONSTRAINT entity_chronicle_fk1 FOREIGN KEY (chronicle_entry_id) REFERENCES chronicle_entry(id),
+    PRIMARY KEY ([entity_type], [entity_id], [tick], [chronicle_entry_id])
+) WITHOUT ROWID;
+
+CREATE INDEX [entity_chronicle_entry_idx] ON [entity_chronicle] ([chronicle_entry_id]);
+
+INSERT OR IGNORE INTO [entity_chronicle] ([entity_type], [entity_id], [tick], [chronicle_entry_id])
+SELECT 'character', l.[character_id], e.[tick], e.[id]
+FROM [character_chronicle] l JOIN [chronicle_entry] e ON e.[id] = l.[chronicle_entry_id];
+
+INSERT OR IGNORE INTO [entity_chronicle] ([entity_type], [entity_id], [tick], [chronicle_entry_id])
+SELECT 'faction', l.[faction_id], e.[tick], e.[id]
+FROM [faction_chronicle] l JOIN [chronicle_entry] e ON e.[id] = l.[chronicle_entry_id];
+
+INSERT OR IGNORE INTO [entity_chronicle] ([entity_type], [entity_id], [tick], [chronicle_entry_id])
+SELECT 'place', l.[place_id], e.[tick], e.[id]
+FROM [place_chronicle] l JOIN [chronicle_entry] e ON e.[id] = l.[chronicle_entry_id];
+
+INSERT OR IGNORE INTO [entity_chronicle] ([entity_type], [entity_id], [tick], [chronicle_entry_id])
+SELECT 'thing', l.[thing_id], e.[tick], e.[id]
+FROM [thing_chronicle] l JOIN [chronicle_entry] e ON e.[id] = l.[chronicle_entry_id];
+
+DROP TABLE [character_chronicle];
+DROP TABLE [faction_chronicle];
+DROP TABLE [place_chronicle];
+DROP TABLE [thing_chronicle];
+
+CREATE TRIGGER [chronicle_entry_entity_tick_update] AFTER UPDATE OF [tick] ON [chronicle_entry]
+WHEN NEW.[tick] IS NOT OLD.[tick]
+BEGIN
+    UPDATE [entity_chronicle] SET [tick] = NEW.[tick] WHERE [chronicle_entry_id] = NEW.[id];
+END;
@@ -0,0 +1,255 @@
+-- Change tracking, for clients that keep a replica of their campaign and sync it with /changes?since=. Every insert
+-- and update of a tracked row stamps it with the next value of the single, database wide change_seq, and every delete
+-- leaves a tombstone in deleted_row stamped the same way. Versions are unique across tables, so the changes since any
+-- version are the rows and tombstones stamped after it.
+--
+-- The update triggers skip the update that stamps the row. A row being made private is also deleted for everyone but
+-- its creator, with a public tombstone stamped before the row itself, so that its creator, who can still see it, gets
+-- it back. Existing rows are versioned in rowid order, one table after another. Memberships have no campaign of their
+-- own, so are found by version alone, then by their faction's campaign.
+CREATE TABLE [change_seq] (
+    [id] INTEGER PRIMARY KEY NOT NULL CHECK ([id] = 1),
+    [version] INTEGER NOT NULL
+);
+
+INSERT INTO [change_seq] ([id], [version]) VALUES (1, 0);
+
+-- [key] is a JSON object of the deleted row's primary key
+CREATE TABLE [deleted_row] (
+    [version] INTEGER PRIMARY KEY NOT NULL,
+    [table_name] VARCHAR(32) NOT NULL,
+    [key] TEXT NOT NULL,
+    [campaign_id] INTEGER NOT NULL,
+    [is_public] TINYINT(1) NOT NULL,
+    [creator_id] CHAR(32) NOT NULL,
+    [deleted_at] INTEGER NOT NULL
+);
+
+CREATE INDEX [deleted_row_campaign_idx] ON [deleted_row] ([campaign_id], [version]);
+
+ALTER TABLE [character] ADD COLUMN [row_version] INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE [character] ADD COLUMN [updated_at] INTEGER;
+
+UPDATE [character] SET [row_version] = (SELECT [version] FROM [change_seq]) + rowid, [updated_at] = strftime('%s');
+UPDATE [change_seq] SET [version] = [version] + coalesce((SELECT max(rowid) FROM [character]), 0);
+
+CREATE INDEX [character_row_version_idx] ON [character] ([campaign_id], [row_version]);
+
+CREATE TRIGGER [character_changes_insert] AFTER INSERT ON [character]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [character] SET [row_version] = (SELECT [version] FROM [change_seq]), [updated_at] = strftime('%s')
+    WHERE [id] = NEW.[id];
+END;
+
+CREATE TRIGGER [character_changes_update] AFTER UPDATE ON [character] WHEN NEW.[row_version] IS OLD.[row_version]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1 WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'character', json_object('id', OLD.[id]),
+        OLD.[campaign_id], 1, OLD.[creator_id], strftime('%s')
+    FROM [change_seq] WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [character] SET [row_version] = (SELECT [version] FROM [change_seq]), [updated_at] = strftime('%s')
+    WHERE [id] = NEW.[id];
+END;
+
+CREATE TRIGGER [character_changes_delete] AFTER DELETE ON [character]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'character', json_object('id', OLD.[id]),
+        OLD.[campaign_id], OLD.[is_public], OLD.[creator_id], strftime('%s')
+    FROM [change_seq];
+END;
+
+ALTER TABLE [faction] ADD COLUMN [row_version] INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE [faction] ADD COLUMN [updated_at] INTEGER;
+
+UPDATE [faction] SET [row_version] = (SELECT [version] FROM [change_seq]) + rowid, [updated_at] = strftime('%s');
+UPDATE [change_seq] SET [version] = [version] + coalesce((SELECT max(rowid) FROM [faction]), 0);
+
+CREATE INDEX [faction_row_version_idx] ON [faction] ([campaign_id], [row_version]);
+
+CREATE TRIGGER [faction_changes_insert] AFTER INSERT ON [faction]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [faction] SET [row_version] = (SELECT [version] FROM [change_seq]), [updated_at] = strftime('%s')
+    WHERE [id] = NEW.[id];
+END;
+
+CREATE TRIGGER [faction_changes_update] AFTER UPDATE ON [faction] WHEN NEW.[row_version] IS OLD.[row_version]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1 WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'faction', json_object('id', OLD.[id]),
+        OLD.[campaign_id], 1, OLD.[creator_id], strftime('%s')
+    FROM [change_seq] WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [faction] SET [row_version] = (SELECT [version] FROM [change_seq]), [updated_at] = strftime('%s')
+    WHERE [id] = NEW.[id];
+END;
+
+CREATE TRIGGER [faction_changes_delete] AFTER DELETE ON [faction]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'faction', json_object('id', OLD.[id]),
+        OLD.[campaign_id], OLD.[is_public], OLD.[creator_id], strftime('%s')
+    FROM [change_seq];
+END;
+
+ALTER TABLE [place] ADD COLUMN [row_version] INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE [place] ADD COLUMN [updated_at] INTEGER;
+
+UPDATE [place] SET [row_version] = (SELECT [version] FROM [change_seq]) + rowid, [updated_at] = strftime('%s');
+UPDATE [change_seq] SET [version] = [version] + coalesce((SELECT max(rowid) FROM [place]), 0);
+
+CREATE INDEX [place_row_version_idx] ON [place] ([campaign_id], [row_version]);
+
+CREATE TRIGGER [place_changes_insert] AFTER INSERT ON [place]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [place] SET [row_version] = (SELECT [version] FROM [change_seq]), [updated_at] = strftime('%s')
+    WHERE [id] = NEW.[id];
+END;
+
+CREATE TRIGGER [place_changes_update] AFTER UPDATE ON [place] WHEN NEW.[row_version] IS OLD.[row_version]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1 WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'place', json_object('id', OLD.[id]),
+        OLD.[campaign_id], 1, OLD.[creator_id], strftime('%s')
+    FROM [change_seq] WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [place] SET [row_version] = (SELECT [version] FROM [change_seq]), [updated_at] = strftime('%s')
+    WHERE [id] = NEW.[id];
+END;
+
+CREATE TRIGGER [place_changes_delete] AFTER DELETE ON [place]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'place', json_object('id', OLD.[id]),
+        OLD.[campaign_id], OLD.[is_public], OLD.[creator_id], strftime('%s')
+    FROM [change_seq];
+END;
+
+ALTER TABLE [thing] ADD COLUMN [row_version] INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE [thing] ADD COLUMN [updated_at] INTEGER;
+
+UPDATE [thing] SET [row_version] = (SELECT [version] FROM [change_seq]) + rowid, [updated_at] = strftime('%s');
+UPDATE [change_seq] SET [version] = [version] + coalesce((SELECT max(rowid) FROM [thing]), 0);
+
+CREATE INDEX [thing_row_version_idx] ON [thing] ([campaign_id], [row_version]);
+
+CREATE TRIGGER [thing_changes_insert] AFTER INSERT ON [thing]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [thing] SET [row_version] = (SELECT [version] FROM [change_seq]), [updated_at] = strftime('%s')
+    WHERE [id] = NEW.[id];
+END;
+
+CREATE TRIGGER [thing_changes_update] AFTER UPDATE ON [thing] WHEN NEW.[row_version] IS OLD.[row_version]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1 WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'thing', json_object('id', OLD.[id]),
+        OLD.[campaign_id], 1, OLD.[creator_id], strftime('%s')
+    FROM [change_seq] WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [thing] SET [row_version] = (SELECT [version] FROM [change_seq]), [updated_at] = strftime('%s')
+    WHERE [id] = NEW.[id];
+END;
+
+CREATE TRIGGER [thing_changes_delete] AFTER DELETE ON [thing]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'thing', json_object('id', OLD.[id]),
+        OLD.[campaign_id], OLD.[is_public], OLD.[creator_id], strftime('%s')
+    FROM [change_seq];
+END;
+
+ALTER TABLE [chronicle_entry] ADD COLUMN [row_version] INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE [chronicle_entry] ADD COLUMN [updated_at] INTEGER;
+
+UPDATE [chronicle_entry] SET [row_version] = (SELECT [version] FROM [change_seq]) + rowid,
+    [updated_at] = strftime('%s');
+UPDATE [change_seq] SET [version] = [version] + coalesce((SELECT max(rowid) FROM [chronicle_entry]), 0);
+
+CREATE INDEX [chronicle_entry_row_version_idx] ON [chronicle_entry] ([campaign_id], [row_version]);
+
+CREATE TRIGGER [chronicle_entry_changes_insert] AFTER INSERT ON [chronicle_entry]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [chronicle_entry] SET [row_version] = (SELECT [version] FROM [change_seq]),
+        [updated_at] = strftime('%s')
+    WHERE [id] = NEW.[id];
+END;
+
+CREATE TRIGGER [chronicle_entry_changes_update] AFTER UPDATE ON [chronicle_entry]
+WHEN NEW.[row_version] IS OLD.[row_version]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1 WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'chronicle_entry', json_object('id', OLD.[id]),
+        OLD.[campaign_id], 1, OLD.[creator_id], strftime('%s')
+    FROM [change_seq] WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [chronicle_entry] SET [row_version] = (SELECT [version] FROM [change_seq]),
+        [updated_at] = strftime('%s')
+    WHERE [id] = NEW.[id];
+END;
+
+CREATE TRIGGER [chronicle_entry_changes_delete] AFTER DELETE ON [chronicle_entry]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'chronicle_entry', json_object('id', OLD.[id]),
+        OLD.[campaign_id], OLD.[is_public], OLD.[creator_id], strftime('%s')
+    FROM [change_seq];
+END;
+
+ALTER TABLE [character_faction] ADD COLUMN [row_version] INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE [character_faction] ADD COLUMN [updated_at] INTEGER;
+
+UPDATE [character_faction] SET [row_version] = (SELECT [version] FROM [change_seq]) + rowid,
+    [updated_at] = strftime('%s');
+UPDATE [change_seq] SET [version] = [version] + coalesce((SELECT max(rowid) FROM [character_faction]), 0);
+
+CREATE INDEX [character_faction_row_version_idx] ON [character_faction] ([row_version]);
+
+CREATE TRIGGER [character_faction_changes_insert] AFTER INSERT ON [character_faction]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [character_faction] SET [row_version] = (SELECT [version] FROM [change_seq]),
+        [updated_at] = strftime('%s')
+    WHERE [character_id] = NEW.[character_id] AND [faction_id] = NEW.[faction_id];
+END;
+
+CREATE TRIGGER [character_faction_changes_update] AFTER UPDATE ON [character_faction]
+WHEN NEW.[row_version] IS OLD.[row_version]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1 WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'character_faction',
+        json_object('character_id', OLD.[character_id], 'faction_id', OLD.[faction_id]),
+        (SELECT [campaign_id] FROM [faction] WHERE [id] = OLD.[faction_id]), 1, OLD.[creator_id], strftime('%s')
+    FROM [change_seq] WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [character_faction] SET [row_version] = (SELECT [version] FROM [change_seq]),
+        [updated_at] = strftime('%s')
+    WHERE [character_id] = NEW.[character_id] AND [faction_id] = NEW.[faction_id];
+END;
+
+CREATE TRIGGER [character_faction_changes_delete] AFTER DELETE ON [character_faction]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'character_faction',
+        json_object('character_id', OLD.[character_id], 'faction_id', OLD.[faction_id]),
+        (SELECT [campaign_id] FROM [faction] WHERE [id] = OLD.[faction_id]), OLD.[is_public], OLD.[creator_id],
+        strftime('%s')
+    FROM [change_seq];
+END;
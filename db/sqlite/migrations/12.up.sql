@@ -0,0 +1,9 @@
+-- The chronicle tick sequence of a new campaign starts at its start_tick, rather than at next_tick's default, as it
+-- did before the sequence existed. Campaigns created since then that have no entries yet are moved onto it too.
+CREATE TRIGGER [campaign_next_tick_insert] AFTER INSERT ON [campaign]
+BEGIN
+    UPDATE [campaign] SET [next_tick] = NEW.[start_tick] WHERE [id] = NEW.[id];
+END;
+
+UPDATE [campaign] SET [next_tick] = [start_tick]
+WHERE NOT EXISTS (SELECT 1 FROM [chronicle_entry] WHERE [chronicle_entry].[campaign_id] = [campaign].[id]);
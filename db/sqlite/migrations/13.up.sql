@@ -0,0 +1,45 @@
+-- A private membership is only visible to the user who created both its character and its faction, which is not
+-- necessarily the membership's own creator_id (and legacy memberships have none), so its tombstones are made visible on
+-- the same terms. Their creator_id is that user, or '' when there is none, in which case a private membership was
+-- never seen by anyone and leaves no tombstone.
+DROP TRIGGER [character_faction_changes_update];
+DROP TRIGGER [character_faction_changes_delete];
+
+CREATE TRIGGER [character_faction_changes_update] AFTER UPDATE ON [character_faction]
+WHEN NEW.[row_version] IS OLD.[row_version]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1 WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'character_faction',
+        json_object('character_id', OLD.[character_id], 'faction_id', OLD.[faction_id]), f.[campaign_id], 1,
+        CASE WHEN c.[creator_id] = f.[creator_id] THEN c.[creator_id] ELSE '' END, strftime('%s')
+    FROM [change_seq] CROSS JOIN [faction] f ON f.[id] = OLD.[faction_id]
+        LEFT JOIN [character] c ON c.[id] = OLD.[character_id]
+    WHERE OLD.[is_public] = 1 AND NEW.[is_public] = 0;
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    UPDATE [character_faction] SET [row_version] = (SELECT [version] FROM [change_seq]),
+        [updated_at] = strftime('%s')
+    WHERE [character_id] = NEW.[character_id] AND [faction_id] = NEW.[faction_id];
+END;
+
+CREATE TRIGGER [character_faction_changes_delete] AFTER DELETE ON [character_faction]
+BEGIN
+    UPDATE [change_seq] SET [version] = [version] + 1;
+    INSERT INTO [deleted_row] ([version], [table_name], [key], [campaign_id], [is_public], [creator_id], [deleted_at])
+    SELECT [version], 'character_faction',
+        json_object('character_id', OLD.[character_id], 'faction_id', OLD.[faction_id]), f.[campaign_id],
+        OLD.[is_public], CASE WHEN c.[creator_id] = f.[creator_id] THEN c.[creator_id] ELSE '' END, strftime('%s')
+    FROM [change_seq] CROSS JOIN [faction] f ON f.[id] = OLD.[faction_id]
+        LEFT JOIN [character] c ON c.[id] = OLD.[character_id]
+    WHERE OLD.[is_public] = 1 OR c.[creator_id] = f.[creator_id];
+END;
+
+-- Tombstones already left are brought onto the same terms
+UPDATE [deleted_row] SET [creator_id] = coalesce((
+    SELECT c.[creator_id] FROM [character] c CROSS JOIN [faction] f
+    WHERE c.[id] = json_extract([deleted_row].[key], '$.character_id')
+        AND f.[id] = json_extract([deleted_row].[key], '$.faction_id') AND c.[creator_id] = f.[creator_id]
+), '')
+WHERE [table_name] = 'character_faction';
+
+DELETE FROM [deleted_row] WHERE [table_name] = 'character_faction' AND [is_public] = 0 AND [creator_id] = '';
@@ -0,0 +1,24 @@
+-- Indexes for the campaign visibility predicate, campaign_id = ? AND (is_public = 1 OR creator_id = ?).
+-- Each leads with the campaign and the collection's sort key, and carries is_public and creator_id so visibility is
+-- checked from the index before the row itself is read.
+CREATE INDEX [character_campaign_name_idx] ON [character] ([campaign_id], [name], [is_public], [creator_id]);
+CREATE INDEX [faction_campaign_name_idx] ON [faction] ([campaign_id], [name], [is_public], [creator_id]);
+CREATE INDEX [place_campaign_name_idx] ON [place] ([campaign_id], [name], [is_public], [creator_id]);
+CREATE INDEX [thing_campaign_name_idx] ON [thing] ([campaign_id], [name], [is_public], [creator_id]);
+CREATE INDEX [chronicle_entry_campaign_tick_idx] ON [chronicle_entry] ([campaign_id], [tick], [id], [is_public], [creator_id]);
+
+-- Chronicle link tables are joined from both sides
+CREATE INDEX [character_chronicle_entry_idx] ON [character_chronicle] ([chronicle_entry_id]);
+CREATE INDEX [character_chronicle_character_idx] ON [character_chronicle] ([character_id], [chronicle_entry_id]);
+CREATE INDEX [faction_chronicle_entry_idx] ON [faction_chronicle] ([chronicle_entry_id]);
+CREATE INDEX [faction_chronicle_faction_idx] ON [faction_chronicle] ([faction_id], [chronicle_entry_id]);
+CREATE INDEX [place_chronicle_entry_idx] ON [place_chronicle] ([chronicle_entry_id]);
+CREATE INDEX [place_chronicle_place_idx] ON [place_chronicle] ([place_id], [chronicle_entry_id]);
+CREATE INDEX [thing_chronicle_entry_idx] ON [thing_chronicle] ([chronicle_entry_id]);
+CREATE INDEX [thing_chronicle_thing_idx] ON [thing_chronicle] ([thing_id], [chronicle_entry_id]);
+
+-- character_faction's primary key only covers lookups by character
+CREATE INDEX [character_faction_faction_idx] ON [character_faction] ([faction_id], [is_public]);
+
+-- Signups sweep expired captchas with [id] = ? OR [time] < ?, which needs both sides indexed to avoid a scan
+CREATE INDEX [captcha_tokens_time_idx] ON [captcha_tokens] ([time]);
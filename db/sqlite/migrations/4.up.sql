@@ -0,0 +1,19 @@
+-- Per-campaign chronicle tick sequence, so the next tick is a primary key lookup rather than a sort over the
+-- campaign's chronicle
+ALTER TABLE [campaign] ADD COLUMN [next_tick] INTEGER NOT NULL DEFAULT 1000;
+
+UPDATE [campaign] SET [next_tick] = coalesce(
+    (SELECT max([tick]) + 1000 FROM [chronicle_entry] WHERE [chronicle_entry].[campaign_id] = [campaign].[id]),
+    [start_tick]
+);
+
+-- Entries placed explicitly, or moved, past the end of the sequence push it forward
+CREATE TRIGGER [chronicle_entry_next_tick_insert] AFTER INSERT ON [chronicle_entry]
+BEGIN
+    UPDATE [campaign] SET [next_tick] = NEW.[tick] + 1000 WHERE [id] = NEW.[campaign_id] AND [next_tick] < NEW.[tick] + 1000;
+END;
+
+CREATE TRIGGER [chronicle_entry_next_tick_update] AFTER UPDATE OF [tick] ON [chronicle_entry]
+BEGIN
+    UPDATE [campaign] SET [next_tick] = NEW.[tick] + 1000 WHERE [id] = NEW.[campaign_id] AND [next_tick] < NEW.[tick] + 1000;
+END;
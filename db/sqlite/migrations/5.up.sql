@@ -0,0 +1,16 @@
+-- Full text search over campaign lore. search_document holds one row per indexed entity, with the campaign and
+-- visibility columns searches filter on, and its id is the rowid of the entity's lore_search row.
+CREATE TABLE [search_document] (
+    [id] INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    [entity_type] VARCHAR(16) NOT NULL,
+    [entity_id] NOT NULL, -- untyped, so integer and text ids keep the type of the entity's own id
+    [name] VARCHAR(64),
+    [campaign_id] INTEGER NOT NULL,
+    [is_public] TINYINT(1) NOT NULL,
+    [creator_id] CHAR(32) NOT NULL,
+    CONSTRAINT search_document_entity_unq1 UNIQUE ([entity_type], [entity_id])
+);
+
+CREATE INDEX [search_document_campaign_idx] ON [search_document] ([campaign_id], [is_public], [creator_id]);
+
+CREATE VIRTUAL TABLE [lore_search] USING fts5([name], [description], [body], tokenize = 'porter unicode61');
@@ -0,0 +1,8 @@
+-- Captchas expire at an absolute unix time, so the sweep is a range scan over this index. [time] holds
+-- time.time() floats, which comparing against date('now', '-1 hour') never expired.
+ALTER TABLE [captcha_tokens] ADD COLUMN [expires_at] REAL NOT NULL DEFAULT 0;
+
+UPDATE [captcha_tokens] SET [expires_at] = CAST([time] AS REAL) + 3600;
+
+DROP INDEX [captcha_tokens_time_idx];
+CREATE INDEX [captcha_tokens_expires_at_idx] ON [captcha_tokens] ([expires_at]);
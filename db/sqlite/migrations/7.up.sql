@@ -0,0 +1,2 @@
+-- Bumped by every write to a campaign's lore, so responses cached from an earlier version are known to be stale
+ALTER TABLE [campaign] ADD COLUMN [version] INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,24 @@
+-- Each faction's count of public members, maintained by the triggers below, so that listing factions reads it
+-- rather than counting every faction's members on each request
+ALTER TABLE [faction] ADD COLUMN [num_members] INTEGER NOT NULL DEFAULT 0;
+
+UPDATE [faction] SET [num_members] = (
+    SELECT count(*) FROM [character_faction] WHERE [faction_id] = [faction].[id] AND [is_public] = 1
+);
+
+CREATE TRIGGER [character_faction_num_members_insert] AFTER INSERT ON [character_faction] WHEN NEW.[is_public] = 1
+BEGIN
+    UPDATE [faction] SET [num_members] = [num_members] + 1 WHERE [id] = NEW.[faction_id];
+END;
+
+CREATE TRIGGER [character_faction_num_members_delete] AFTER DELETE ON [character_faction] WHEN OLD.[is_public] = 1
+BEGIN
+    UPDATE [faction] SET [num_members] = [num_members] - 1 WHERE [id] = OLD.[faction_id];
+END;
+
+-- A membership made public or private, or moved to another faction
+CREATE TRIGGER [character_faction_num_members_update] AFTER UPDATE OF [is_public], [faction_id] ON [character_faction]
+BEGIN
+    UPDATE [faction] SET [num_members] = [num_members] - 1 WHERE [id] = OLD.[faction_id] AND OLD.[is_public] = 1;
+    UPDATE [faction] SET [num_members] = [num_members] + 1 WHERE [id] = NEW.[faction_id] AND NEW.[is_public] = 1;
+END;
@@ -0,0 +1,5 @@
+-- Reverse lookups for the campaign graph's traversal, which follows every link from either end. The other directions
+-- are the tables' primary keys, and region_city's unique city_id.
+CREATE INDEX [dungeon_place_place_idx] ON [dungeon_place] ([place_id]);
+CREATE INDEX [inventory_thing_idx] ON [inventory] ([thing_id]);
+CREATE INDEX [thing_owner_idx] ON [thing] ([owner_id]);
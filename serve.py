@@ -1,11 +1,14 @@
-import sqlite3
 from src.lore_log import API
-from migrate import Migration
+from src.lore_log.db import Database, OrderedMigration
+from src.lore_log.fts import index_missing
+from src.lore_log.search import searchable_models
 import os
 from wsgiref import simple_server
 
-db = sqlite3.Connection("temp.sqlite")
-Migration(os.path.dirname(os.path.realpath(__file__)) + "/db/sqlite/migrations", db)()
+db = Database("temp.sqlite")
+OrderedMigration(os.path.dirname(os.path.realpath(__file__)) + "/db/sqlite/migrations", db.connection())()
+with db.transaction() as conn:
+    index_missing(conn, os.path.dirname(os.path.realpath(__file__)), searchable_models)
 
 app = API(db, os.path.dirname(os.path.realpath(__file__)))
 
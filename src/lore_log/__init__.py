@@ -1,5 +1,4 @@
 import falcon
-import sqlite3
 from .users import UsersResource, Login, Profile, Captcha
 from .characters import Characters, Character
 from .factions import Factions, Faction
@@ -7,7 +6,18 @@ from .places import Places, Place
 from .things import Things, Thing
 from .chronicle import ChronicleEntries, ChronicleEntry
 from .utils import JWT_KEY
+from .cache import ClaimsCache, FileCache, ResponseCache
+from .passwords import PasswordHasher
+from .captcha import CaptchaStore, SqliteCaptchaStore
+from .db import Database
 from .relationships import CharacterRelations, CharacterRelation, FactionRelations
+from .search import Search
+from .graph import Graph
+from .changes import Changes
+from .campaigns import CampaignExport, CampaignImport
+from .metrics import Metrics, MetricsMiddleware, MetricsResource
+from .profiling import SqlProfiler, SqlProfilerMiddleware, SqlProfiles
+from .response_cache import ResponseCacheMiddleware
 from falcon_auth import FalconAuthMiddleware, JWTAuthBackend
 
 
@@ -17,30 +27,64 @@ __version__ = "0.2.0"
 class API(falcon.API):
     """ The HTTP REST API for the storage service. """
 
-    def __init__(self, sql_conn: sqlite3.Connection, data_path: str, **kwargs):
-        users_resource = UsersResource(sql_conn, data_path)
+    def __init__(self, db: Database, data_path: str, claims_cache_size: int = 4096,
+                 claims_cache_ttl: float = 60, rich_description_cache_bytes: int = 64 * 1024 * 1024,
+                 bcrypt_rounds: int = 12, bcrypt_workers: int = 2, bcrypt_max_queue: int = 16,
+                 response_cache_bytes: int = 16 * 1024 * 1024,
+                 captcha_store: CaptchaStore = None, metrics: Metrics = None, sql_profiler: SqlProfiler = None,
+                 **kwargs):
+        # Shared by every users resource so that invalidating a user affects the auth middleware immediately
+        self.claims_cache = ClaimsCache(claims_cache_size, claims_cache_ttl)
+        # Shared by every resource so that a description written by one is a cache hit when read by another
+        self.file_cache = FileCache(rich_description_cache_bytes)
+        # Collection responses, for as long as their campaign doesn't change. A budget of 0 turns it off
+        self.response_cache = ResponseCache(response_cache_bytes) if response_cache_bytes else None
+        # Shared by every users resource so that signups and logins together are bounded by one pool
+        self.password_hasher = PasswordHasher(bcrypt_workers, bcrypt_max_queue, bcrypt_rounds)
+        # Defaults to the database, which every worker process shares
+        self.captcha_store = captcha_store if captcha_store is not None else SqliteCaptchaStore(db)
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics.caches.setdefault("claims", self.claims_cache)
+        self.metrics.caches.setdefault("files", self.file_cache)
+        if self.response_cache is not None:
+            self.metrics.caches.setdefault("responses", self.response_cache)
+        users_resource = UsersResource(db, data_path, self.claims_cache, self.password_hasher, self.captcha_store)
         auth_backend = JWTAuthBackend(users_resource.validate_claims, JWT_KEY,
                                       required_claims=['exp', 'selected_campaign', 'email'])
         auth_middleware = FalconAuthMiddleware(auth_backend,
-                                               exempt_routes=['/users', '/login', '/captcha'],
+                                               exempt_routes=['/users', '/login', '/captcha', '/metrics'],
                                                exempt_methods=['HEAD', 'OPTIONS'])
-        super().__init__(middleware=[auth_middleware], **kwargs)
-        auth_resource = Login(sql_conn, data_path)
-        profile_resource = Profile(sql_conn, data_path)
-        captcha_resource = Captcha(sql_conn, data_path)
-        characters_resource = Characters(sql_conn, data_path)
-        character_resource = Character(sql_conn, data_path)
-        factions_resource = Factions(sql_conn, data_path)
-        faction_resource = Faction(sql_conn, data_path)
-        places_resource = Places(sql_conn, data_path)
-        place_resource = Place(sql_conn, data_path)
-        things_resource = Things(sql_conn, data_path)
-        thing_resource = Thing(sql_conn, data_path)
-        entries_resource = ChronicleEntries(sql_conn, data_path)
-        entry_resource = ChronicleEntry(sql_conn, data_path)
-        char_rels_resource = CharacterRelations(sql_conn, data_path)
-        char_rel_resource = CharacterRelation(sql_conn, data_path)
-        faction_rels_resource = FactionRelations(sql_conn, data_path)
+        # Off unless given, as it keeps every statement each request runs
+        self.sql_profiler = sql_profiler
+        # Metrics first, so that the time spent authenticating is part of each request's latency
+        middleware = [MetricsMiddleware(self.metrics)]
+        if sql_profiler is not None:
+            middleware.append(SqlProfilerMiddleware(sql_profiler))
+        middleware.append(auth_middleware)
+        if self.response_cache is not None:
+            middleware.append(ResponseCacheMiddleware(db, self.response_cache))
+        super().__init__(middleware=middleware, **kwargs)
+        auth_resource = Login(db, data_path, self.claims_cache, self.password_hasher, self.captcha_store)
+        profile_resource = Profile(db, data_path, self.claims_cache, self.password_hasher, self.captcha_store)
+        captcha_resource = Captcha(db, data_path, self.captcha_store)
+        characters_resource = Characters(db, data_path, self.file_cache)
+        character_resource = Character(db, data_path, self.file_cache)
+        factions_resource = Factions(db, data_path, self.file_cache)
+        faction_resource = Faction(db, data_path, self.file_cache)
+        places_resource = Places(db, data_path, self.file_cache)
+        place_resource = Place(db, data_path, self.file_cache)
+        things_resource = Things(db, data_path, self.file_cache)
+        thing_resource = Thing(db, data_path, self.file_cache)
+        entries_resource = ChronicleEntries(db, data_path, self.file_cache)
+        entry_resource = ChronicleEntry(db, data_path, self.file_cache)
+        char_rels_resource = CharacterRelations(db, data_path, self.file_cache)
+        char_rel_resource = CharacterRelation(db, data_path, self.file_cache)
+        faction_rels_resource = FactionRelations(db, data_path, self.file_cache)
+        search_resource = Search(db, data_path, self.file_cache)
+        graph_resource = Graph(db, data_path, self.file_cache)
+        changes_resource = Changes(db, data_path, self.file_cache)
+        export_resource = CampaignExport(db, data_path, self.file_cache)
+        import_resource = CampaignImport(db, data_path, self.file_cache)
         self.add_route("/users/", users_resource)
         self.add_route("/login", auth_resource)
         self.add_route("/profile", profile_resource)
@@ -57,6 +101,15 @@ class API(falcon.API):
         self.add_route("/things/{thing_id}", thing_resource)
         self.add_route("/chronicle/", entries_resource)
         self.add_route("/chronicle/{entry_id}", entry_resource)
+        self.add_route("/search", search_resource)
+        self.add_route("/graph", graph_resource)
+        self.add_route("/changes", changes_resource)
+        self.add_route("/metrics", MetricsResource(self.metrics))
+        if sql_profiler is not None:
+            self.add_route("/debug/sql", SqlProfiles(sql_profiler))
+            self.add_route("/debug/sql/{profile_id}", SqlProfiles(sql_profiler))
+        self.add_route("/campaigns/{campaign_id}/export", export_resource)
+        self.add_route("/campaigns/{campaign_id}/import", import_resource)
         self.add_route("/characters/{character_id}/relations/{relation_type}", char_rels_resource)
         self.add_route("/characters/{character_id}/relations/{relation_type}/{relation_id}", char_rel_resource)
         self.add_route("/factions/{faction_id}/relations/{relation_type}", faction_rels_resource)
@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from .metrics import current
+from threading import Lock
+import time
+import os
+
+
+class LRUCache:
+    """ A bounded, thread-safe LRU cache with an optional time-to-live for each entry
+
+    By default every entry counts 1 towards `max_size`. Passing `size_of` weighs entries instead, e.g. by their size in
+    bytes.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = None, size_of=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size_of = size_of
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None, valid=None):
+        """ Returns the cached value for key. A value rejected by `valid`, if given, is dropped and counts as a miss """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires, _ = entry
+            if (expires is not None and expires < time.monotonic()) or (valid is not None and not valid(value)):
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        size = self._size_of(value) if self._size_of is not None else 1
+        if size > self.max_size:
+            # Would evict everything else and still not fit
+            self.invalidate(key)
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def pop(self, key, default=None):
+        """ Removes and returns the cached value for key, as long as it hasn't expired """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._remove(key)
+            if entry[1] is not None and entry[1] < time.monotonic():
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def expire(self) -> int:
+        """ Removes every expired entry, returning how many there were """
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires, _) in self._entries.items() if expires is not None and expires < now]
+            for key in expired:
+                self._remove(key)
+        return len(expired)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_where(self, predicate):
+        """ Removes every entry whose key satisfies the predicate """
+        with self._lock:
+            for key in [each for each in self._entries if predicate(each)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class ClaimsCache(LRUCache):
+    """ Caches successfully validated JWT claims, keyed by (user id, email, selected campaign)
+
+    The API drops a user's claims whenever it changes them. Changes made to the user, user_campaign_map or profile
+    tables outside of the API, such as deactivating a user by hand, are only seen once the user's claims expire, so
+    `ttl` is the longest a deactivated user or a removed campaign membership is still let in.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 60):
+        super().__init__(max_entries, ttl)
+
+    def invalidate_user(self, user_id: str):
+        """ Drops every cached claim for a user, e.g. when their campaigns change """
+        self.invalidate_where(lambda key: key[0] == user_id)
+
+
+class FileCache(LRUCache):
+    """ Caches the contents of rich description files, bounded by their total size in bytes
+
+    Each file is cached with its mtime and size, and a cached copy is only used while the file on disk still matches,
+    so edits made outside of the API are picked up on the next read.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        super().__init__(max_bytes, size_of=lambda entry: entry[1])
+
+    def read(self, path: str) -> str:
+        stat = os.stat(path)
+        entry = self.get(path, valid=lambda entry: entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size)
+        if entry is not None:
+            current.counts.cached_reads += 1
+            return entry[2]
+        current.counts.disk_reads += 1
+        with open(path) as f:
+            text = f.read()
+        self.put(path, (stat.st_mtime_ns, stat.st_size, text))
+        return text
+
+    def write(self, path: str, text: str):
+        with open(path, "w") as f:
+            f.write(text)
+        stat = os.stat(path)
+        self.put(path, (stat.st_mtime_ns, stat.st_size, text))
+
+    def remove(self, path: str):
+        self.invalidate(path)
+        os.remove(path)
+
+
+class ResponseCache(LRUCache):
+    """ Caches serialized GET responses, bounded by the total size of their bodies in bytes
+
+    Entries are (campaign version, body, content type, headers), and are only used while their campaign is still at
+    the version they were built from.
+    """
+
+    # Roughly what an entry costs besides its body
+    entry_overhead = 256
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        super().__init__(max_bytes, size_of=lambda entry: len(entry[1]) + self.entry_overhead)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,256 @@
+from .resource import Resource
+from .fts import index_missing
+from .search import searchable_models
+from .model import first_free_id, scalar_types
+from .utils import generate_new_id
+from .metrics import current
+from os import path, remove
+import falcon
+import sqlite3
+import json
+
+# Tables with their own ids, in the order they are exported, mapped to their columns that reference another table's id
+entity_tables = {
+    "character": {},
+    "faction": {},
+    "place": {},
+    "thing": {"owner_id": "character"},
+    "chronicle_entry": {},
+}
+
+# Tables linking entities, mapped to the join that finds their campaign, and to their columns that reference ids
+link_tables = {
+    "character_faction": ("JOIN [faction] p ON p.id = t.faction_id",
+                          {"character_id": "character", "faction_id": "faction"}),
+    "region_city": ("JOIN [place] p ON p.id = t.region_id", {"region_id": "place", "city_id": "place"}),
+    "dungeon_place": ("JOIN [place] p ON p.id = t.dungeon_id", {"dungeon_id": "place", "place_id": "place"}),
+    "inventory": ("JOIN [character] p ON p.id = t.character_id", {"character_id": "character", "thing_id": "thing"}),
+    # entity_id references the table named by each row's entity_type
+    "entity_chronicle": ("JOIN [chronicle_entry] p ON p.id = t.chronicle_entry_id",
+                         {"chronicle_entry_id": "chronicle_entry"}),
+}
+
+# The types of entity chronicle entries can be about
+chronicle_entity_types = ("character", "faction", "place", "thing")
+# The per-type link tables entity_chronicle replaced, which snapshots from before it still have rows of, mapped to the
+# entity type of their rows
+legacy_chronicle_tables = {f"{each}_chronicle": each for each in chronicle_entity_types}
+
+# Columns that are specific to the database a snapshot was taken from, or are maintained from other rows, and are
+# never exported
+local_columns = {"external_file_name", "num_members", "row_version", "updated_at"}
+
+
+class CampaignResource(Resource):
+
+    def validate_master(self, req: falcon.Request, campaign_id):
+        row = self._read_db.execute("""
+        SELECT [is_master] FROM [user_campaign_map] WHERE [user_id] = ? AND [campaign_id] = ?
+        """, (req.context['user']['id'], campaign_id)).fetchone()
+        if not row or not row[0]:
+            raise falcon.HTTPForbidden(title="Only the campaign's master can export or import it")
+
+
+class CampaignExport(CampaignResource):
+    """ Streams a snapshot of a whole campaign as newline delimited JSON """
+
+    # Lines are written in chunks of about this many bytes
+    chunk_size = 64 * 1024
+
+    def on_get(self, req: falcon.Request, res: falcon.Response, campaign_id):
+        self.validate_master(req, campaign_id)
+        res.content_type = "application/x-ndjson"
+        res.stream = self._chunks(self._lines(int(campaign_id)))
+
+    def _lines(self, campaign_id: int):
+        conn = self._read_db
+        # Every table is read in one transaction, so the snapshot is of a single moment even though the response is
+        # streamed, and no link row can point at an entity written after that entity's table was read. It ends when
+        # the stream is finished or closed, as the read connection is reused by the thread's later requests.
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT [name], [description], [start_tick] FROM [campaign] WHERE [id] = ?",
+                               (campaign_id,)).fetchone()
+            yield {"table": "campaign", "row": {"name": row[0], "description": row[1], "start_tick": row[2]}}
+            for table in entity_tables:
+                yield from self._rows(table, f"SELECT * FROM [{table}] WHERE [campaign_id] = ?", campaign_id)
+            for table, (join, _) in link_tables.items():
+                yield from self._rows(table, f"SELECT t.* FROM [{table}] t {join} WHERE p.campaign_id = ?",
+                                      campaign_id)
+        finally:
+            conn.rollback()
+
+    def _rows(self, table: str, sql: str, campaign_id: int):
+        c = self._read_db.cursor()
+        c.execute(sql, (campaign_id,))
+        columns = [each[0] for each in c.description]
+        file_index = columns.index("external_file_name") if "external_file_name" in columns else None
+        for row in c:
+            data = {column: value for column, value in zip(columns, row) if column not in local_columns}
+            if file_index is not None and row[file_index]:
+                # Read straight from disk rather than through the cache, so an export doesn't evict hot descriptions
+                current.counts.disk_reads += 1
+                with open(path.join(self._path, row[file_index])) as f:
+                    data["rich_description"] = f.read()
+            yield {"table": table, "row": data}
+
+    def _chunks(self, lines):
+        chunk = []
+        size = 0
+        for line in lines:
+            line = json.dumps(line, ensure_ascii=False) + "\n"
+            chunk.append(line)
+            size += len(line)
+            if size >= self.chunk_size:
+                yield "".join(chunk).encode()
+                chunk = []
+                size = 0
+        yield "".join(chunk).encode()
+
+
+class CampaignImport(CampaignResource):
+    """ Loads a snapshot written by CampaignExport into an existing campaign, in a single transaction
+
+    Every entity gets a new id, and references between entities are rewritten to match. Authorship is kept for users
+    that exist in this database, and is otherwise given to the importing user.
+    """
+
+    # Rows are inserted with executemany in batches of this size
+    batch_size = 1000
+    # The request body is read in chunks of this many bytes
+    read_size = 64 * 1024
+
+    def on_post(self, req: falcon.Request, res: falcon.Response, campaign_id):
+        self.validate_master(req, campaign_id)
+        with self.transaction() as db:
+            c = db.cursor()
+            # Take the write lock up front, as new ids are allocated from the current max ids
+            if not db.in_transaction:
+                c.execute("BEGIN IMMEDIATE")
+            counts = self._load(c, req, int(campaign_id))
+            self.bump_campaign_version(db, int(campaign_id))
+            index_missing(db, self._path, searchable_models, int(campaign_id))
+        res.media = counts
+        res.status = falcon.HTTP_CREATED
+
+    def _load(self, c: sqlite3.Cursor, req: falcon.Request, campaign_id: int) -> dict:
+        user_id = req.context['user']['id']
+        users = set(row[0] for row in c.execute("SELECT [id] FROM [user]"))
+        columns = {}
+        next_ids = {}
+        id_maps = {table: {} for table in entity_tables}
+        # Of each imported chronicle entry, by its new id
+        ticks = {}
+        batches = {}
+        counts = {}
+
+        # The first and last line numbers of each batch, for errors
+        batch_lines = {}
+
+        def flush(key):
+            table, names = key
+            first, last = batch_lines.pop(key)
+            try:
+                c.executemany("INSERT INTO [{}] ({}) VALUES ({})".format(
+                    table, ",".join(f"[{name}]" for name in names), ",".join(["?"] * len(names))), batches.pop(key))
+            except sqlite3.IntegrityError as e:
+                raise falcon.HTTPBadRequest(
+                    title=f"snapshot lines {first}-{last} conflict with this campaign's {table} rows: {e}")
+            except sqlite3.DatabaseError as e:
+                raise falcon.HTTPBadRequest(title=f"invalid {table} rows on snapshot lines {first}-{last}: {e}")
+
+        for number, line in enumerate(self._read_lines(req.bounded_stream), 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                table, data = item["table"], item["row"]
+            except (ValueError, KeyError, TypeError):
+                raise falcon.HTTPBadRequest(title=f"invalid snapshot line {number}")
+            if not isinstance(table, str) or not isinstance(data, dict) \
+                    or not all(isinstance(value, scalar_types) for value in data.values()) \
+                    or not isinstance(data.get("rich_description") or "", str):
+                raise falcon.HTTPBadRequest(title=f"invalid row on snapshot line {number}")
+            if table == "campaign":
+                continue
+            if table in legacy_chronicle_tables:
+                entity_type = legacy_chronicle_tables[table]
+                table, data = "entity_chronicle", {"entity_type": entity_type,
+                                                   "entity_id": data.get(f"{entity_type}_id"),
+                                                   "chronicle_entry_id": data.get("chronicle_entry_id")}
+            if table not in entity_tables and table not in link_tables:
+                raise falcon.HTTPBadRequest(title=f"unknown table {table} on snapshot line {number}")
+            if table not in columns:
+                columns[table] = [row[1] for row in c.execute(f"PRAGMA table_info([{table}])")]
+            references = entity_tables[table] if table in entity_tables else link_tables[table][1]
+            if table == "entity_chronicle":
+                if data.get("entity_type") not in chronicle_entity_types:
+                    raise falcon.HTTPBadRequest(title=f"invalid entity type on snapshot line {number}")
+                references = dict(references, entity_id=data["entity_type"])
+            # An entity's own id, and both ends of a link
+            required = ("id",) if table in entity_tables else tuple(references)
+            missing = [column for column in required if data.get(column) is None]
+            if missing:
+                raise falcon.HTTPBadRequest(title="missing {} on snapshot line {}".format(", ".join(missing), number))
+
+            row = {column: data[column] for column in columns[table] if column in data and column not in local_columns}
+            for column, referenced in references.items():
+                if row.get(column) is not None:
+                    if str(row[column]) not in id_maps[referenced]:
+                        raise falcon.HTTPBadRequest(
+                            title=f"{column} on snapshot line {number} is not a {referenced} in the snapshot")
+                    row[column] = id_maps[referenced][str(row[column])]
+            if table == "entity_chronicle":
+                # A copy of the entry's tick, which is taken from the entry rather than trusted to match it
+                row["tick"] = ticks.get(row["chronicle_entry_id"])
+            if table in entity_tables:
+                row["id"] = self._new_id(c, table, next_ids)
+                # Keyed by the text of the old id, as some link columns store integer ids as text
+                id_maps[table][str(data["id"])] = row["id"]
+                if table == "chronicle_entry":
+                    ticks[row["id"]] = row.get("tick")
+                row["campaign_id"] = campaign_id
+                if data.get("rich_description"):
+                    # Written straight to disk rather than through the cache, like the export reads them
+                    file_path = path.join(self._path, generate_new_id())
+                    with open(file_path, "w") as f:
+                        f.write(data["rich_description"])
+                    self._database.after_rollback(lambda file_path=file_path: remove(file_path))
+                    row["external_file_name"] = path.basename(file_path)
+            else:
+                # Link tables' own ids are local, and are regenerated
+                row.pop("id", None)
+            if "creator_id" in row and row["creator_id"] not in users:
+                row["creator_id"] = user_id
+
+            key = (table, tuple(row.keys()))
+            batches.setdefault(key, []).append(tuple(row.values()))
+            batch_lines[key] = (batch_lines.get(key, (number,))[0], number)
+            counts[table] = counts.get(table, 0) + 1
+            if len(batches[key]) >= self.batch_size:
+                flush(key)
+        for key in list(batches):
+            flush(key)
+        return counts
+
+    def _read_lines(self, stream):
+        """ Yields the lines of the request body, reading it in chunks rather than all at once """
+        rest = b""
+        while True:
+            chunk = stream.read(self.read_size)
+            if not chunk:
+                break
+            lines = (rest + chunk).split(b"\n")
+            rest = lines.pop()
+            yield from lines
+        yield rest
+
+    @staticmethod
+    def _new_id(c: sqlite3.Cursor, table: str, next_ids: dict):
+        if table == "chronicle_entry":
+            return generate_new_id()
+        if table not in next_ids:
+            next_ids[table] = first_free_id(c, table)
+        id = next_ids[table]
+        next_ids[table] += 1
+        return id
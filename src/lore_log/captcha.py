@@ -0,0 +1,104 @@
+from .cache import LRUCache
+from .db import Database
+from abc import ABC, abstractmethod
+import threading
+import logging
+import time
+import os
+
+
+class CaptchaStore(ABC):
+    """ Holds the answers of issued captchas until they are used or expire """
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+
+    @abstractmethod
+    def put(self, id: str, answer: str):
+        pass
+
+    @abstractmethod
+    def take(self, id: str):
+        """ Removes a captcha, returning its answer, or None if there is no such captcha or it has expired """
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """ Removes every expired captcha, returning how many there were """
+
+
+class MemoryCaptchaStore(CaptchaStore):
+    """ Keeps captchas in a bounded in-memory cache.
+
+    Each process has its own store, so this is only suitable when a single process serves the API.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 65536):
+        super().__init__(ttl)
+        self._answers = LRUCache(max_entries, ttl)
+
+    def put(self, id: str, answer: str):
+        self._answers.put(id, answer)
+
+    def take(self, id: str):
+        return self._answers.pop(id)
+
+    def sweep(self) -> int:
+        return self._answers.expire()
+
+
+class SqliteCaptchaStore(CaptchaStore):
+    """ Keeps captchas in the captcha_tokens table, shared by every process.
+
+    Expired captchas are never accepted, and are deleted every `sweep_interval` seconds by a background thread in each
+    process that uses the store.
+    """
+
+    def __init__(self, db: Database, ttl: float = 3600, sweep_interval: float = 300):
+        super().__init__(ttl)
+        self._database = db
+        self.sweep_interval = sweep_interval
+        self._sweeper_pid = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def put(self, id: str, answer: str):
+        self._start_sweeper()
+        now = time.time()
+        with self._database.transaction() as db:
+            db.execute("INSERT INTO [captcha_tokens] ([id], [answer], [time], [expires_at]) VALUES (?, ?, ?, ?)",
+                       (id, answer, now, now + self.ttl))
+
+    def take(self, id: str):
+        self._start_sweeper()
+        # Its own transaction, so a captcha is used up even if whatever it was for fails
+        with self._database.transaction() as db:
+            # Taken under the write lock, so a captcha can only ever be used once
+            if not db.in_transaction:
+                db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT [answer] FROM [captcha_tokens] WHERE [id] = ? AND [expires_at] >= ?",
+                             (id, time.time())).fetchone()
+            db.execute("DELETE FROM [captcha_tokens] WHERE [id] = ?", (id,))
+        return row[0] if row else None
+
+    def sweep(self) -> int:
+        with self._database.transaction() as db:
+            return db.execute("DELETE FROM [captcha_tokens] WHERE [expires_at] < ?", (time.time(),)).rowcount
+
+    def _start_sweeper(self):
+        # Threads don't survive a fork, so each worker process starts its own sweeper
+        if self._sweeper_pid == os.getpid() or self.sweep_interval is None:
+            return
+        with self._lock:
+            if self._sweeper_pid != os.getpid():
+                threading.Thread(target=self._sweep_forever, name="captcha-sweeper", daemon=True).start()
+                self._sweeper_pid = os.getpid()
+
+    def _sweep_forever(self):
+        while not self._stopped.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                logging.exception("Failed to sweep expired captchas")
+
+    def stop(self):
+        self._stopped.set()
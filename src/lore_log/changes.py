@@ -0,0 +1,89 @@
+from .resource import Resource
+from .characters import CharacterModel
+from .factions import FactionModel
+from .places import PlaceModel
+from .things import ThingModel
+from .chronicle import ChronicleEntryModel
+from .relationships import CharacterFactionModel
+import falcon
+import json
+
+
+_visible = "t.[campaign_id] = :campaign AND (t.[is_public] = 1 OR t.[creator_id] = :user)"
+
+
+def _changed_rows(model, names, source: str, where: str = _visible, columns: dict = None) -> tuple:
+    """ The field names and query of a tracked table's rows visible to :user and stamped in (:since, :until].
+
+    `columns` maps any of `names` that are not columns of the table, aliased `t`, to their sql.
+    """
+    columns = [(columns or {}).get(each) or model.column(each, "t") for each in names]
+    return tuple(names) + ("row_version", "updated_at"), f"""
+    SELECT {",".join(columns)}, t.[row_version], t.[updated_at] FROM {source}
+    WHERE t.[row_version] > :since AND t.[row_version] <= :until AND {where}
+    ORDER BY t.[row_version] LIMIT :limit"""
+
+
+# The tracked tables (see migration 11), with the fields of their rows that are sent, which are those of their list
+# views. Memberships are visible on the same terms as on /relations: when public, or when the user owns both sides.
+change_tables = {
+    "character": _changed_rows(CharacterModel, CharacterModel.summary_names, "[character] t"),
+    "faction": _changed_rows(FactionModel, FactionModel.summary_names + ("num_members",), "[faction] t"),
+    "place": _changed_rows(PlaceModel, PlaceModel.summary_names, "[place] t"),
+    "thing": _changed_rows(ThingModel, ThingModel.summary_names, "[thing] t"),
+    "chronicle_entry": _changed_rows(
+        ChronicleEntryModel, ChronicleEntryModel.summary_names,
+        "[chronicle_entry] t LEFT JOIN [entity_chronicle] link ON link.[chronicle_entry_id] = t.[id]",
+        columns={"relation_id": "link.[entity_id]"}),
+    "character_faction": _changed_rows(
+        CharacterFactionModel, CharacterFactionModel.fields,
+        "[character_faction] t CROSS JOIN [faction] f ON f.[id] = t.[faction_id] "
+        "CROSS JOIN [character] c ON c.[id] = t.[character_id]",
+        "f.[campaign_id] = :campaign AND (t.[is_public] = 1 OR (c.[creator_id] = :user AND f.[creator_id] = :user))"),
+}
+
+# Tombstones are visible on the same terms as the rows they replace, as their creator_id is whoever could see the row
+# while it was private (see migrations 11 and 13)
+_deleted_sql = """
+SELECT [version], [table_name], [key] FROM [deleted_row]
+WHERE [campaign_id] = :campaign AND [version] > :since AND [version] <= :until
+    AND ([is_public] = 1 OR [creator_id] = :user)
+ORDER BY [version] LIMIT :limit"""
+
+
+class Changes(Resource):
+    """ What has changed in the user's campaign since a version, for clients that keep a replica of it.
+
+    `since` is the `version` of the client's last sync, or 0 for everything. The response has the changed rows of each
+    tracked table, with their row_version, and the keys of deleted rows, and its `version` is the one to sync from
+    next. At most `limit` changes are sent at once, oldest first, and `more` says whether there are more to fetch.
+    """
+
+    default_limit = 1000
+    max_limit = 10000
+
+    def on_get(self, req: falcon.Request, res: falcon.Response):
+        since = req.get_param_as_int("since", required=True, min_value=0)
+        limit = req.get_param_as_int("limit", min_value=1, max_value=self.max_limit) or self.default_limit
+        c = self._read_db.cursor()
+        # Everything is read up to the version at the start, so a change made while reading is left for the next sync
+        # rather than being missed, as the row it changed may already have been read
+        until = c.execute("SELECT [version] FROM [change_seq] WHERE [id] = 1").fetchone()[0]
+        args = {"campaign": req.context['user']['campaign'], "user": req.context['user']['id'], "since": since,
+                "until": until, "limit": limit + 1}
+        changes = []
+        for table, (names, sql) in change_tables.items():
+            changes += [(row[-2], table, dict(zip(names, row))) for row in c.execute(sql, args)]
+        changes += [(version, None, {"table": table, "key": json.loads(key), "version": version})
+                    for version, table, key in c.execute(_deleted_sql, args)]
+        changes.sort(key=lambda change: change[0])
+        more = len(changes) > limit
+        if more:
+            # Every change up to the limit-th overall has been read, as a table with more unread has limit + 1 rows
+            # read before them
+            changes = changes[:limit]
+            until = changes[-1][0]
+        result = {"version": until, "more": more, "changes": {table: [] for table in change_tables}, "deleted": []}
+        for _, table, change in changes:
+            (result["changes"][table] if table else result["deleted"]).append(change)
+        res.media = result
@@ -1,5 +1,6 @@
 from .resource import Resource
 from .model import Model
+from .pagination import Page
 import falcon
 from sqlite3 import IntegrityError
 
@@ -12,6 +13,9 @@ class CharacterModel(Model):
                     "dex": "attr_dex_2", "con": "attr_con_3", "int": "attr_int_4", "wis": "attr_wis_5",
                     "cha": "attr_cha_6"
                     }
+    summary_fields = {"id", "name", "race", "level", "class", "class_level", "is_pc", "is_public"}
+    # notes are private to the creator, so are not searchable
+    search_fields = ["name", "description"]
     table_name = "character"
     exception_map = {
         IntegrityError: falcon.HTTPBadRequest("Duplicate Character exists in this campaign")
@@ -19,8 +23,12 @@ class CharacterModel(Model):
 
 
 class Characters(Resource):
+    cache_responses = True
+
     def on_post(self,  req: falcon.Request, res: falcon.Response):
-        """ Create a new character. Any authenticated user may create a character """
+        """ Create a new character, or many from an array. Any authenticated user may create a character """
+        if isinstance(req.media, list):
+            return self.create_many(CharacterModel, req, res)
         character = CharacterModel.from_req(req)
         self.create(character, res)
 
@@ -28,74 +36,52 @@ class Characters(Resource):
         """ Retrieve a list of characters, not a single record """
         user_id = req.context["user"]['id']
         campaign_id = req.context["user"]['campaign']
-        c = self._db.cursor()
-        # TODO paginate
+        names = self.requested_fields(req, CharacterModel.summary_names)
+        page = Page(req, ("[name]", "[id]"))
+        columns, key = page.select(CharacterModel.column(each) for each in names)
+        c = self._read_db.cursor()
         rows = c.execute("""
-        SELECT [id], [name], [race], [level], [primary_class], [primary_class_level], [is_pc], [is_public]
+        SELECT {}
         FROM character
-        WHERE (is_public=1 OR creator_id=?) AND campaign_id=?
-        """, (user_id, campaign_id)).fetchall()
-        characters = []
-        for row in rows:
-            characters.append({
-                'id': row[0],
-                'name': row[1],
-                'race': row[2],
-                'level': row[3],
-                'class': row[4],
-                'class_level': row[5],
-                'is_pc': bool(row[6]),
-                'is_public': bool(row[7])
-            })
-        res.media = characters
+        WHERE (is_public=1 OR creator_id=?) AND campaign_id=?{}
+        ORDER BY {} {}
+        """.format(", ".join(columns), page.predicate, page.order_by, page.limit_clause),
+            [user_id, campaign_id] + page.args)
+        self.send_collection(req, res, rows, page, key, lambda row: {
+            name: bool(value) if name in ("is_pc", "is_public") else value for name, value in zip(names, row)
+        })
         res.status = falcon.HTTP_OK
 
 
 class Character(Resource):
     def on_get(self, req: falcon.Request, res: falcon.Response, character_id):
         """ Get a single character record, by id """
-        c = self._db.cursor()
-        row = c.execute("""
-        SELECT [id], [name], [race], [level], [description], [primary_class], [primary_class_level], [secondary_class], 
-        [secondary_class_level], is_pc, attributes_public, creator_id, alignment, attr_str_1, attr_dex_2, attr_con_3, 
-        attr_int_4, attr_wis_5, attr_cha_6, attr_stats_other, is_public, sheet_url, notes
-        FROM character
-        WHERE id = ? AND (is_public = 1 OR creator_id = ?)
-        """, (character_id, req.context['user']['id'])).fetchone()
+        c = self._read_db.cursor()
+        row = c.execute(CharacterModel.select_sql + " WHERE id = ? AND (is_public = 1 OR creator_id = ?)",
+                        (character_id, req.context['user']['id'])).fetchone()
         if not row:
             raise falcon.HTTPNotFound(title="No character was found with id {} or unauthorized".format(character_id))
-        character = {
-            'id': row[0],
-            'name': row[1],
-            'race': row[2],
-            'level': row[3],
-            'description': row[4],
-            'class': row[5],
-            'class_level': row[6],
-            'secondary_class': row[7],
-            'secondary_class_level': row[8],
-            'is_pc': bool(row[9]),
-            'creator_id': row[11]
-        }
-        if row[10] or row[11] == req.context['user']['id']:
-            character.update({
-                'attributes_public': bool(row[10]),
-                'alignment': row[12],
-                'str': row[13],
-                'dex': row[14],
-                'con': row[15],
-                'int': row[16],
-                'wis': row[17],
-                'cha': row[18],
-                'attr_stats_other': row[19],
-            })
-        if row[11] == req.context['user']['id']:
+        self.check_not_modified(req, res, self.detail_etag(req, CharacterModel, row))
+        model = CharacterModel.from_db(row).to_dict()
+        is_owner = model['creator_id'] == req.context['user']['id']
+        character = {each: model[each] for each in ('id', 'name', 'race', 'level', 'description', 'class',
+                                                    'class_level', 'secondary_class', 'secondary_class_level')}
+        character.update({
+            'is_pc': bool(model['is_pc']),
+            'creator_id': model['creator_id']
+        })
+        if model['attributes_public'] or is_owner:
+            character.update({each: model[each] for each in ('alignment', 'str', 'dex', 'con', 'int', 'wis', 'cha',
+                                                             'attr_stats_other')})
+            character['attributes_public'] = bool(model['attributes_public'])
+        if is_owner:
             character.update({
-                "is_public": bool(row[20]),
-                "sheet_url": row[21],
-                "notes": row[22]
+                "is_public": bool(model['is_public']),
+                "sheet_url": model['sheet_url'],
+                "notes": model['notes']
             })
-        res.media = character
+        names = self.requested_fields(req, CharacterModel.field_names)
+        res.media = {name: value for name, value in character.items() if name in names}
         res.status = falcon.HTTP_OK
 
     def on_patch(self, req: falcon.Request, res: falcon.Response, character_id):
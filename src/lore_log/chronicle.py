@@ -1,15 +1,16 @@
 from .resource import Resource
 from .model import Model
+from .pagination import Page
 import falcon
 from .utils import generate_new_id
-import os
 
 
 class ChronicleEntryModel(Model):
     fields = ['id', 'title', 'tick', 'relation_type', 'external_file_name', 'campaign_id', 'creator_id', 'is_public']
     extra_fields = {"rich_description", "relation_id"}
-    summary_fields = {"id", "title", "tick", "is_public", "relation_type"}
+    summary_fields = {"id", "title", "tick", "is_public", "relation_type", "relation_id"}
     autoincrement_id = False
+    search_fields = ["title"]
     table_name = "chronicle_entry"
 
 
@@ -17,29 +18,70 @@ valid_types = {"character", "faction", "domain", "place", "thing"}
 
 
 class ChronicleEntries(Resource):
+    cache_responses = True
 
     def on_get(self, req: falcon.Request, res: falcon.Response):
-        where = "WHERE campaign_id = ? AND (creator_id = ? OR is_public=1)"
+        """ The chronicle, newest first. `relation_type` narrows it to entries about that type of entity, and with
+        `relation_id` to one entity's timeline, which `include=factions` widens to the factions a character is in.
+        `from_tick` and `to_tick` narrow it to a range of ticks.
+        """
+        where = "WHERE chronicle.campaign_id = ? AND (chronicle.creator_id = ? OR chronicle.is_public=1)"
         where_args = [req.context['user']['campaign'], req.context['user']['id']]
-        join = ""
-        if req.params.get("relation_type", None) is not None:
-            type = req.params["relation_type"]
-            join = f"JOIN {type}_chronicle subset ON subset.chronicle_entry_id = chronicle.id"
-            if req.params.get("relation_id"):
-                where += f" AND subset.{type}_id = ?"
-                where_args.append(req.params.get('relation_id'))
-        sql = "SELECT {} FROM chronicle_entry chronicle {} {} ORDER BY tick DESC".format(
-            ",".join(f"chronicle.{field}" for field in ChronicleEntryModel.fields),
-            join,
-            where
+        relation_type = req.get_param("relation_type")
+        relation_id = req.get_param("relation_id")
+        include = [name for each in req.get_param_as_list("include") or () for name in each.split(",") if name]
+        if relation_type is not None and relation_type not in valid_types:
+            raise falcon.HTTPBadRequest(title="invalid relation type: {}".format(relation_type))
+        if include and (include != ["factions"] or relation_type != "character" or not relation_id):
+            raise falcon.HTTPBadRequest(title="include=factions is only valid for a character's chronicle")
+        from_tick = req.get_param_as_int("from_tick")
+        to_tick = req.get_param_as_int("to_tick")
+        names = self.requested_fields(req, ChronicleEntryModel.summary_names)
+        columns = [ChronicleEntryModel.column(each, "chronicle") for each in names]
+        if relation_type is not None and relation_id:
+            # Driven by the entity's range of entity_chronicle, which is already in timeline order
+            tick = "link.[tick]"
+            sql = "FROM entity_chronicle link " \
+                  "CROSS JOIN chronicle_entry chronicle ON chronicle.id = link.chronicle_entry_id"
+            entity = "link.entity_type = ? AND link.entity_id = ?"
+            entity_args = [relation_type, relation_id]
+            if include:
+                entity = f"""({entity} OR link.entity_type = 'faction' AND link.entity_id IN (
+                    SELECT [faction_id] FROM [character_faction] WHERE [character_id] = ?
+                    AND ([is_public] = 1 OR [creator_id] = ?)))"""
+                entity_args += [relation_id, req.context['user']['id']]
+            where += " AND " + entity
+            where_args += entity_args
+            page = Page(req, ("link.[tick]", "link.[chronicle_entry_id]"), descending=True)
+        else:
+            tick = "chronicle.[tick]"
+            sql = "FROM chronicle_entry chronicle"
+            if "relation_id" in names:
+                sql += " LEFT JOIN entity_chronicle link ON link.chronicle_entry_id = chronicle.id"
+            if relation_type is not None:
+                where += " AND chronicle.relation_type = ?"
+                where_args.append(relation_type)
+            page = Page(req, ("chronicle.[tick]", "chronicle.[id]"), descending=True)
+        if "relation_id" in names:
+            columns[names.index("relation_id")] = "link.[entity_id]"
+        if from_tick is not None:
+            where += f" AND {tick} >= ?"
+            where_args.append(from_tick)
+        if to_tick is not None:
+            where += f" AND {tick} <= ?"
+            where_args.append(to_tick)
+        columns, key = page.select(columns)
+        sql = "SELECT {} {} {}{} ORDER BY {} {}".format(
+            ",".join(columns),
+            sql,
+            where,
+            page.predicate,
+            page.order_by,
+            page.limit_clause
         )
-        cursor = self._db.cursor()
-        rows = cursor.execute(sql, where_args)
-        entries = []
-        for row in rows:
-            entry = ChronicleEntryModel.from_db(row).to_summary_dict()
-            entries.append(entry)
-        res.media = entries
+        cursor = self._read_db.cursor()
+        rows = cursor.execute(sql, where_args + page.args)
+        self.send_collection(req, res, rows, page, key, lambda row: dict(zip(names, row)))
 
     def on_post(self, req: falcon.Request, res: falcon.Response):
         entry = ChronicleEntryModel.from_req(req)
@@ -49,52 +91,50 @@ class ChronicleEntries(Resource):
             raise falcon.HTTPBadRequest(title="missing required relation_id field")
         if not entry.rich_description:
             raise falcon.HTTPBadRequest(title="chronicle entries require a description")
-        cursor = self._db.cursor()
-        row = cursor.execute("""SELECT [id] FROM [{}] WHERE id=? AND creator_id=? AND campaign_id=?""".format(
-            entry.relation_type), (entry.relation_id, req.context['user']['id'], req.context['user']['campaign'])
-        ).fetchone()
-        if not row:
-            raise falcon.HTTPNotFound(title="no such {} exists or unauthorized".format(entry.relation_type))
-        entry.id = generate_new_id()
-        if not entry.tick:
-            # Get the next tick in the sequence if they didn't populate tick explicitly
-            row = cursor.execute("SELECT [tick] FROM chronicle_entry WHERE campaign_id = ? ORDER BY [tick] DESC LIMIT 1",
-                                 (req.context['user']['campaign'],)).fetchone()
+        # The entry and its link are one commit
+        with self.transaction() as db:
+            cursor = db.cursor()
+            row = cursor.execute("""SELECT [id] FROM [{}] WHERE id=? AND creator_id=? AND campaign_id=?""".format(
+                entry.relation_type), (entry.relation_id, req.context['user']['id'], req.context['user']['campaign'])
+            ).fetchone()
             if not row:
-                row = cursor.execute("SELECT [start_tick] FROM campaign WHERE id = ?",
+                raise falcon.HTTPNotFound(title="no such {} exists or unauthorized".format(entry.relation_type))
+            entry.id = generate_new_id()
+            if not entry.tick:
+                # Take the next tick in the campaign's sequence if they didn't populate tick explicitly. Advancing the
+                # sequence first takes the write lock, so concurrent posts can't be given the same tick.
+                cursor.execute("UPDATE [campaign] SET [next_tick] = [next_tick] + 1000 WHERE [id] = ?",
+                               (req.context['user']['campaign'],))
+                row = cursor.execute("SELECT [next_tick] - 1000 FROM [campaign] WHERE [id] = ?",
                                      (req.context['user']['campaign'],)).fetchone()
                 entry.tick = int(row[0])
-            else:
-                entry.tick = int(row[0]) + 1000
-        self.create(entry, res)
-        sql = f"""INSERT INTO {entry.relation_type}_chronicle 
-            ([{entry.relation_type}_id], [chronicle_entry_id])
-            VALUES (?, ?)
-        """
-        cursor.execute(sql, (entry.relation_id, entry.id))
-        self._db.commit()
+            self.create(entry, res)
+            cursor.execute("""
+            INSERT INTO [entity_chronicle] ([entity_type], [entity_id], [tick], [chronicle_entry_id])
+            VALUES (?, ?, ?, ?)
+            """, (entry.relation_type, entry.relation_id, entry.tick, entry.id))
 
 
 class ChronicleEntry(Resource):
+    # The entry's columns, then what it is about, which is the first of its extra fields
+    select_sql = "SELECT {}, link.[entity_id] FROM chronicle_entry chronicle " \
+                 "LEFT JOIN entity_chronicle link ON link.chronicle_entry_id = chronicle.id".format(
+                     ",".join(ChronicleEntryModel.column(each, "chronicle") for each in ChronicleEntryModel.fields))
+
     def on_get(self, req: falcon.Request, res: falcon.Response, entry_id):
-        c = self._db.cursor()
-        row = c.execute("""
-                 SELECT {}
-                 FROM chronicle_entry
-                 WHERE id=? AND (creator_id=? OR is_public=1)
-                 """.format(",".join(f"[{field}]" for field in ChronicleEntryModel.fields)),
+        c = self._read_db.cursor()
+        row = c.execute(self.select_sql + " WHERE chronicle.id=? AND (chronicle.creator_id=? OR chronicle.is_public=1)",
                         (entry_id, req.context['user']['id'])).fetchone()
         if not row:
             raise falcon.HTTPNotFound(title="No entry found with id {} or unauthorized".format(entry_id))
+        # Only the entry's own columns, to match the ETag PATCH checks If-Match against
+        self.check_not_modified(req, res, self.detail_etag(req, ChronicleEntryModel,
+                                                           row[:len(ChronicleEntryModel.fields)]))
+        names = self.requested_fields(req, ChronicleEntryModel.field_names)
         entry = ChronicleEntryModel.from_db(row)
-        related_row = c.execute(f"""
-        SELECT [{entry.relation_type}_id] FROM {entry.relation_type}_chronicle WHERE chronicle_entry_id=?
-        """, (entry.id,)).fetchone()
-        entry.relation_id = related_row[0]
-        if entry.external_file_name:
-            with open(os.path.join(self._path, entry.external_file_name)) as f:
-                entry.rich_description = f.read()
-        res.media = entry.to_dict()
+        if entry.external_file_name and "rich_description" in names:
+            entry.rich_description = self.read_rich_description(entry.external_file_name)
+        res.media = entry.to_dict(names)
 
     def on_patch(self, req: falcon.Request, res: falcon.Response, entry_id):
         self.update(ChronicleEntryModel, req, entry_id)
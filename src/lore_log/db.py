@@ -0,0 +1,275 @@
+from migrate import Migration
+from .metrics import TimedConnection
+from contextlib import contextmanager
+import sqlite3
+import threading
+import logging
+import time
+import os
+
+
+class ConnectionPool:
+    """ Hands out one sqlite connection per thread, reconnecting in each forked worker process """
+
+    def __init__(self, path: str, readonly: bool = False, busy_timeout: float = 5.0, mmap_size: int = 268435456):
+        self.path = path
+        self.readonly = readonly
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        # Connections inherited across a fork must never be closed by the child, as closing them would release the
+        # parent's file locks. They are kept referenced here instead.
+        self._inherited = []
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        if self.readonly:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=self.busy_timeout,
+                                   check_same_thread=check_same_thread, factory=TimedConnection)
+        else:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=check_same_thread,
+                                   factory=TimedConnection)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        pid = os.getpid()
+        if conn is not None and self._local.pid == pid:
+            return conn
+        if conn is not None:
+            self._inherited.append(conn)
+        conn = self._connect()
+        self._local.conn = conn
+        self._local.pid = pid
+        return conn
+
+    def close(self):
+        """ Closes the calling thread's connection, if it has one """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+
+class GroupCommit:
+    """ Commits the writes of concurrent requests together, in one transaction per `window` seconds.
+
+    Every write goes through one shared connection, behind a lock. Each request's writes are a savepoint inside the
+    shared transaction, so a failing request only rolls back its own writes. A background thread commits the shared
+    transaction once a window has passed since the first write released into it, and only then do the requests in
+    that group return, so no request responds before its writes are durable.
+    """
+
+    def __init__(self, path: str, window: float, busy_timeout: float = 5.0, mmap_size: int = 268435456):
+        self.window = window
+        self._pool = ConnectionPool(path, busy_timeout=busy_timeout, mmap_size=mmap_size)
+        # Held by the request currently writing, and by the committer
+        self._lock = threading.RLock()
+        self._groups = threading.Condition()
+        # The group currently being filled, and the last group to be committed
+        self._group = 1
+        self._committed = 0
+        self._pending = False
+        self._errors = {}
+        self._conn = None
+        self._pid = None
+        # A connection inherited across a fork is kept referenced, as closing it would release the parent's locks
+        self._inherited = []
+
+    def connection(self) -> sqlite3.Connection:
+        # One connection per process, shared by its threads, with transactions managed explicitly
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    if self._conn is not None:
+                        self._inherited.append(self._conn)
+                    self._conn = self._pool._connect(check_same_thread=False)
+                    self._conn.isolation_level = None
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._commit_forever, name="group-commit", daemon=True).start()
+        return self._conn
+
+    @contextmanager
+    def scope(self):
+        conn = self.connection()
+        with self._lock:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            conn.execute("SAVEPOINT request")
+            try:
+                yield conn
+            except BaseException:
+                # Some errors (e.g. a full disk) roll back the whole transaction, savepoint included
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK TO request")
+                    conn.execute("RELEASE request")
+                raise
+            conn.execute("RELEASE request")
+            with self._groups:
+                group = self._group
+                self._pending = True
+                self._groups.notify_all()
+        self._wait(group)
+
+    def _wait(self, group: int):
+        with self._groups:
+            while self._committed < group:
+                self._groups.wait()
+            error = self._errors.get(group)
+        if error is not None:
+            raise error
+
+    def _commit_forever(self):
+        conn = self._conn
+        while True:
+            with self._groups:
+                while not self._pending:
+                    self._groups.wait()
+            time.sleep(self.window)
+            error = None
+            with self._lock:
+                with self._groups:
+                    group = self._group
+                    self._group += 1
+                    self._pending = False
+                try:
+                    conn.execute("COMMIT")
+                except sqlite3.Error as e:
+                    logging.exception("Group commit failed")
+                    error = e
+                    try:
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                    except sqlite3.Error:
+                        logging.exception("Group rollback failed")
+            with self._groups:
+                self._committed = group
+                if error is not None:
+                    self._errors[group] = error
+                for each in [each for each in self._errors if each < group - 100]:
+                    del self._errors[each]
+                self._groups.notify_all()
+
+
+class Database:
+    """ Provides per-thread connections to a sqlite database in WAL mode.
+
+    Writes go through `connection()`, inside a `transaction()` scope. Reads that do not need to see the current
+    request's uncommitted writes should use `read_connection()`, a separate read-only pool, so that they never wait on a
+    writer.
+
+    Passing `group_commit_window` makes every write share one connection instead, committing the scopes of concurrent
+    requests together (see GroupCommit). That trades a little latency for one commit per group of requests rather than
+    one per request, which matters most when commits are synced to disk.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0, mmap_size: int = 268435456,
+                 group_commit_window: float = None):
+        self.path = path
+        self._writers = ConnectionPool(path, busy_timeout=busy_timeout, mmap_size=mmap_size)
+        self._readers = ConnectionPool(path, readonly=True, busy_timeout=busy_timeout, mmap_size=mmap_size)
+        self._group_commit = GroupCommit(path, group_commit_window, busy_timeout, mmap_size) \
+            if group_commit_window is not None else None
+        self._scope = threading.local()
+        # WAL is persistent in the database file, so it only needs setting once. This also creates the file before
+        # any read-only connection tries to open it.
+        self._writers.connection().execute("PRAGMA journal_mode=WAL")
+
+    def connection(self) -> sqlite3.Connection:
+        if self._group_commit is not None:
+            return self._group_commit.connection()
+        return self._writers.connection()
+
+    def read_connection(self) -> sqlite3.Connection:
+        return self._readers.connection()
+
+    @contextmanager
+    def transaction(self):
+        """ Makes everything written inside it one atomic commit, however many scopes are nested inside it.
+
+        Only the outermost scope commits, or rolls back if an exception escapes it. Callbacks registered with
+        `after_commit` or `after_rollback` run once the outcome is known.
+        """
+        scope = self._scope
+        if getattr(scope, "depth", 0):
+            scope.depth += 1
+            try:
+                yield self.connection()
+            finally:
+                scope.depth -= 1
+            return
+
+        scope.depth = 1
+        scope.after_commit = []
+        scope.after_rollback = []
+        try:
+            if self._group_commit is not None:
+                with self._group_commit.scope() as conn:
+                    yield conn
+            else:
+                conn = self.connection()
+                try:
+                    yield conn
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+        except BaseException:
+            callbacks = scope.after_rollback
+            self._end_scope()
+            self._run(callbacks)
+            raise
+        callbacks = scope.after_commit
+        self._end_scope()
+        self._run(callbacks)
+
+    def _end_scope(self):
+        self._scope.depth = 0
+        self._scope.after_commit = []
+        self._scope.after_rollback = []
+
+    @staticmethod
+    def _run(callbacks: list):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logging.exception("Transaction callback failed")
+
+    def after_commit(self, callback):
+        """ Runs callback once the current transaction scope commits, e.g. to delete a file it no longer uses.
+
+        Outside of a scope there is nothing left to commit, so it runs straight away.
+        """
+        if getattr(self._scope, "depth", 0):
+            self._scope.after_commit.append(callback)
+        else:
+            callback()
+
+    def after_rollback(self, callback):
+        """ Runs callback if the current transaction scope rolls back, e.g. to delete a file it created """
+        if getattr(self._scope, "depth", 0):
+            self._scope.after_rollback.append(callback)
+
+    def close(self):
+        self._writers.close()
+        self._readers.close()
+
+
+class OrderedMigration(Migration):
+    """ Runs migrations in numeric order.
+
+    nimbus-migrate applies files in directory listing order, which is arbitrary, and later migrations depend on the
+    tables created by earlier ones.
+    """
+
+    def run_migration_directory(self):
+        suffix = ".up.sql" if self._up else ".dn.sql"
+        names = sorted((file[:-len(suffix)] for file in os.listdir(self._mig_dir) if file.endswith(suffix)),
+                       key=lambda name: (int(name) if name.isdigit() else float("inf"), name), reverse=not self._up)
+        for name in names:
+            if (name not in self._ran_migrations) == self._up:
+                with open(os.path.join(self._mig_dir, name + suffix)) as f:
+                    self.run_migration(f.read(), name)
+        print("All migrations ran successfully")
@@ -1,42 +1,42 @@
 from .model import Model
 from .resource import Resource
-import os
+from .pagination import Page
 import falcon
 
 
 class FactionModel(Model):
     fields = ["id", "name", "description", "external_file_name", "is_public", "campaign_id", "creator_id"]
     table_name = "faction"
+    search_fields = ["name", "description"]
     extra_fields = {"rich_description"}
+    summary_fields = {"id", "name", "description", "is_public"}
     autoincrement_id = True
 
 
 class Factions(Resource):
     """ Implements actions to act on the collection of factions """
+    cache_responses = True
 
     def on_get(self, req: falcon.Request, res: falcon.Response):
         """ Retrieve a list of all factions """
-        c = self._db.cursor()
+        names = self.requested_fields(req, FactionModel.summary_names + ("num_members",))
+        page = Page(req, ("[name]", "[id]"))
+        # Public members are counted as memberships change (see migration 8), and are not a field clients can write
+        columns, key = page.select("[num_members]" if each == "num_members" else FactionModel.column(each)
+                                   for each in names)
+        c = self._read_db.cursor()
         rows = c.execute("""
-        SELECT id, name, description, is_public, count(DISTINCT character_id) FROM (
-            SELECT [id], [name], [description], [faction].[is_public], character_id FROM faction
-            left outer JOIN character_faction cf on faction.id = cf.faction_id and cf.is_public = 1
-            WHERE campaign_id = ? AND (faction.is_public = 1 OR faction.creator_id = ?)
-        ) GROUP BY id, name, description, is_public;
-        """, (req.context["user"]["campaign"], req.context["user"]["id"]))
-        factions = []
-        for row in rows:
-            factions.append({
-                "id": row[0],
-                "name": row[1],
-                "description": row[2],
-                "is_public": row[3],
-                "num_members": row[4]
-            })
-        res.media = factions
+        SELECT {} FROM faction
+        WHERE campaign_id = ? AND (faction.is_public = 1 OR faction.creator_id = ?){}
+        ORDER BY {} {}
+        """.format(", ".join(columns), page.predicate, page.order_by, page.limit_clause),
+            [req.context["user"]["campaign"], req.context["user"]["id"]] + page.args)
+        self.send_collection(req, res, rows, page, key, lambda row: dict(zip(names, row)))
 
     def on_post(self, req: falcon.Request, res: falcon.Response):
-        """ Create a new faction in the current campaign """
+        """ Create a new faction in the current campaign, or many from an array """
+        if isinstance(req.media, list):
+            return self.create_many(FactionModel, req, res)
         faction = FactionModel.from_req(req)
         self.create(faction, res)
 
@@ -45,18 +45,17 @@ class Faction(Resource):
 
     def on_get(self, req: falcon.Request, res: falcon.Response, faction_id: str):
         """ GET a single faction """
-        c = self._db.cursor()
-        row = c.execute("""
-        SELECT [id], [name], [description], external_file_name, is_public, campaign_id, creator_id FROM faction
-        WHERE id=? AND (creator_id=? OR is_public=1)
-        """, (faction_id, req.context['user']['id'])).fetchone()
+        c = self._read_db.cursor()
+        row = c.execute(FactionModel.select_sql + " WHERE id=? AND (creator_id=? OR is_public=1)",
+                        (faction_id, req.context['user']['id'])).fetchone()
         if not row:
             raise falcon.HTTPNotFound(title="No faction found with id {} or unauthorized".format(faction_id))
+        self.check_not_modified(req, res, self.detail_etag(req, FactionModel, row))
+        names = self.requested_fields(req, FactionModel.field_names)
         faction = FactionModel.from_db(row)
-        if faction.external_file_name:
-            with open(os.path.join(self._path, faction.external_file_name)) as f:
-                faction.rich_description = f.read()
-        res.media = faction.to_dict()
+        if faction.external_file_name and "rich_description" in names:
+            faction.rich_description = self.read_rich_description(faction.external_file_name)
+        res.media = faction.to_dict(names)
 
     def on_patch(self, req: falcon.Request, res: falcon.Response, faction_id: str):
         """ Update a single faction object """
@@ -0,0 +1,69 @@
+import sqlite3
+import os
+import re
+from typing import ClassVar
+
+_tags = re.compile(r"<[^>]*>")
+
+
+def match_query(text: str) -> str:
+    """ Turns free text into an fts5 query matching every word, with the last word matched as a prefix
+
+    Each word is quoted so that fts5 syntax in user input is searched for literally.
+    """
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if words:
+        words[-1] += "*"
+    return " ".join(words)
+
+
+def index_document(db: sqlite3.Connection, model: ClassVar, id, body: str = None):
+    """ (Re)indexes the stored row `id` of `model`, along with its rich description text, for full text search """
+    if not model.search_fields:
+        return
+    c = db.cursor()
+    row = c.execute("SELECT [id], {}, [campaign_id], [is_public], [creator_id] FROM [{}] WHERE [id] = ?".format(
+        ",".join(f"[{model.alias_fields.get(field, field)}]" for field in model.search_fields), model.table_name),
+        (id,)).fetchone()
+    if row is None:
+        return
+    id = row[0]
+    num_fields = len(model.search_fields)
+    name = row[1]
+    description = " ".join(each for each in row[2:num_fields + 1] if each)
+    # Rich descriptions are stored as markup, and only their text should be searchable
+    body = _tags.sub(" ", body) if body else ""
+    c.execute("""
+    INSERT INTO [search_document] ([entity_type], [entity_id], [name], [campaign_id], [is_public], [creator_id])
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT ([entity_type], [entity_id]) DO UPDATE SET [name] = excluded.[name],
+    [campaign_id] = excluded.[campaign_id], [is_public] = excluded.[is_public], [creator_id] = excluded.[creator_id]
+    """, (model.table_name, id, name) + tuple(row[num_fields + 1:]))
+    document_id = c.execute("SELECT [id] FROM [search_document] WHERE [entity_type] = ? AND [entity_id] = ?",
+                            (model.table_name, id)).fetchone()[0]
+    c.execute("DELETE FROM [lore_search] WHERE rowid = ?", (document_id,))
+    c.execute("INSERT INTO [lore_search] (rowid, [name], [description], [body]) VALUES (?, ?, ?, ?)",
+              (document_id, name, description, body))
+
+
+def index_missing(db: sqlite3.Connection, data_path: str, models: list, campaign_id: int = None):
+    """ Indexes every row of `models` that isn't in the search index yet, e.g. rows written before it existed
+
+    Passing `campaign_id` only looks at that campaign's rows. Nothing is committed, so callers can index inside their
+    own transaction.
+    """
+    c = db.cursor()
+    for model in models:
+        has_file = model.has_external_file_name()
+        rows = c.execute("""
+        SELECT [id]{} FROM [{}] WHERE {}[id] NOT IN (
+            SELECT [entity_id] FROM [search_document] WHERE [entity_type] = ?
+        )""".format(", [external_file_name]" if has_file else "", model.table_name,
+                    "[campaign_id] = ? AND " if campaign_id is not None else ""),
+            ((campaign_id,) if campaign_id is not None else ()) + (model.table_name,)).fetchall()
+        for row in rows:
+            body = None
+            if has_file and row[1] and os.path.exists(os.path.join(data_path, row[1])):
+                with open(os.path.join(data_path, row[1])) as f:
+                    body = f.read()
+            index_document(db, model, row[0], body)
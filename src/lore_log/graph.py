@@ -0,0 +1,109 @@
+from .resource import Resource
+import falcon
+
+# The links between entities the graph follows, as (from type, to type, kind, reversed, join). Each link is followed
+# from both ends, and `reversed` is 1 when following it from its target, so that edges always point the same way:
+# characters to their factions and things, regions to their cities, and dungeons to their places. `walk` is the node
+# being expanded, `l` the link table and `n` the neighbouring entity. The joins are CROSS JOINs, which sqlite never
+# reorders, as otherwise it may start from every place in the campaign rather than the links of the node.
+graph_links = [
+    ("character", "faction", "member", 0, """
+        CROSS JOIN [character_faction] l
+            ON l.[character_id] = walk.[id] AND (l.[is_public] = 1 OR l.[creator_id] = :user)
+        CROSS JOIN [faction] n ON n.[id] = l.[faction_id]"""),
+    ("faction", "character", "member", 1, """
+        CROSS JOIN [character_faction] l
+            ON l.[faction_id] = walk.[id] AND (l.[is_public] = 1 OR l.[creator_id] = :user)
+        CROSS JOIN [character] n ON n.[id] = l.[character_id]"""),
+    ("place", "place", "region_city", 0, """
+        CROSS JOIN [region_city] l ON l.[region_id] = walk.[id] CROSS JOIN [place] n ON n.[id] = l.[city_id]"""),
+    ("place", "place", "region_city", 1, """
+        CROSS JOIN [region_city] l ON l.[city_id] = walk.[id] CROSS JOIN [place] n ON n.[id] = l.[region_id]"""),
+    ("place", "place", "dungeon_place", 0, """
+        CROSS JOIN [dungeon_place] l ON l.[dungeon_id] = walk.[id] CROSS JOIN [place] n ON n.[id] = l.[place_id]"""),
+    ("place", "place", "dungeon_place", 1, """
+        CROSS JOIN [dungeon_place] l ON l.[place_id] = walk.[id] CROSS JOIN [place] n ON n.[id] = l.[dungeon_id]"""),
+    ("character", "thing", "owner", 0, """
+        CROSS JOIN [thing] n ON n.[owner_id] = walk.[id]"""),
+    ("thing", "character", "owner", 1, """
+        CROSS JOIN [thing] l ON l.[id] = walk.[id] CROSS JOIN [character] n ON n.[id] = l.[owner_id]"""),
+    ("character", "thing", "inventory", 0, """
+        CROSS JOIN [inventory] l ON l.[character_id] = walk.[id] AND l.[is_public] = 1
+        CROSS JOIN [thing] n ON n.[id] = l.[thing_id]"""),
+    ("thing", "character", "inventory", 1, """
+        CROSS JOIN [inventory] l ON l.[thing_id] = walk.[id] AND l.[is_public] = 1
+        CROSS JOIN [character] n ON n.[id] = l.[character_id]"""),
+]
+
+# Breadth first from the root, one row per (node, depth, the node it was reached from), carrying each node's name so
+# that no second pass is needed. Neighbours are only reached if they are visible to the user and in their campaign,
+# so the walk never passes through what the user cannot see. A node reached several ways has a row for each, which
+# is what yields the edges, and the walk stops after :rows rows whatever the depth.
+graph_sql = """
+WITH RECURSIVE walk([type], [id], [name], [depth], [from_type], [from_id], [kind], [reversed]) AS (
+    SELECT :root_type, :root_id, :root_name, 0, NULL, NULL, NULL, 0
+    {}
+    LIMIT :rows
+)
+SELECT * FROM walk
+""".format("".join(f"""
+    UNION
+    SELECT '{to_type}', n.[id], n.[name], walk.[depth] + 1, walk.[type], walk.[id], '{kind}', {reversed}
+    FROM walk {join}
+    WHERE walk.[type] = '{from_type}' AND walk.[depth] < :depth
+        AND n.[campaign_id] = :campaign AND (n.[is_public] = 1 OR n.[creator_id] = :user)"""
+                   for from_type, to_type, kind, reversed, join in graph_links))
+
+
+class Graph(Resource):
+    """ The graph of who and what is connected to an entity, within a number of links of it.
+
+    `root` is the entity to start from, as type:id. The response lists the nodes reached, each with its distance from
+    the root, and the edges between them as [source, target, kind], where source and target are indexes into the
+    nodes. Edges between two nodes at the maximum depth are not followed, so are not included.
+    """
+
+    cache_responses = True
+    default_depth = 2
+    max_depth = 4
+    default_nodes = 200
+    max_nodes = 1000
+    # The walk has a row per way each node is reached, so is bounded at this many times the node limit
+    rows_per_node = 8
+
+    def on_get(self, req: falcon.Request, res: falcon.Response):
+        root_type, _, root_id = req.get_param("root", required=True).partition(":")
+        if root_type not in ("character", "faction", "place", "thing"):
+            raise falcon.HTTPBadRequest(title=f"invalid graph root type: {root_type}")
+        depth = req.get_param_as_int("depth", min_value=0, max_value=self.max_depth)
+        depth = self.default_depth if depth is None else depth
+        limit = req.get_param_as_int("limit", min_value=1, max_value=self.max_nodes) or self.default_nodes
+        user_id = req.context['user']['id']
+        campaign_id = req.context['user']['campaign']
+        c = self._read_db.cursor()
+        root = c.execute(f"""
+            SELECT [id], [name] FROM [{root_type}] WHERE [id] = ? AND [campaign_id] = ?
+            AND ([is_public] = 1 OR [creator_id] = ?)
+        """, (root_id, campaign_id, user_id)).fetchone()
+        if root is None:
+            raise falcon.HTTPNotFound(title=f"no such {root_type} with id {root_id} exists or unauthorized")
+        rows = c.execute(graph_sql, {"root_type": root_type, "root_id": root[0], "root_name": root[1], "depth": depth,
+                                     "campaign": campaign_id, "user": user_id,
+                                     "rows": limit * self.rows_per_node}).fetchall()
+        truncated = len(rows) == limit * self.rows_per_node
+        nodes = []
+        index = {}
+        edges = set()
+        for node_type, node_id, name, node_depth, from_type, from_id, kind, reversed in rows:
+            key = (node_type, node_id)
+            if key not in index:
+                if len(nodes) == limit:
+                    truncated = True
+                    continue
+                index[key] = len(nodes)
+                nodes.append({"type": node_type, "id": node_id, "name": name, "depth": node_depth})
+            source = index.get((from_type, from_id))
+            if source is None:
+                continue
+            edges.add((index[key], source, kind) if reversed else (source, index[key], kind))
+        res.media = {"nodes": nodes, "edges": sorted(edges), "truncated": truncated}
@@ -0,0 +1,296 @@
+from collections import deque
+from bisect import bisect_left
+from time import perf_counter
+import threading
+import sqlite3
+import falcon
+
+# Upper bounds, in seconds, of the request latency histogram's buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Quantiles reported over each route's most recent requests
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RequestCounts:
+    """ What one request has done so far, counted by the connections and caches it uses.
+
+    `trace` is None unless the request is being profiled, and is then a list of (sql, seconds) for each statement.
+    """
+    __slots__ = ("statements", "sql_seconds", "disk_reads", "cached_reads", "trace")
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.disk_reads = 0
+        self.cached_reads = 0
+        self.trace = None
+
+
+class CurrentRequest(threading.local):
+    """ The counts of the request each thread is currently handling """
+
+    def __init__(self):
+        self.counts = RequestCounts()
+
+
+current = CurrentRequest()
+
+
+def count_statement(sql: str, start: float):
+    seconds = perf_counter() - start
+    counts = current.counts
+    counts.statements += 1
+    counts.sql_seconds += seconds
+    if counts.trace is not None:
+        counts.trace.append((sql, seconds))
+
+
+class TimedCursor(sqlite3.Cursor):
+    """ Counts and times each statement it executes. The time includes stepping to the first row, but not fetching """
+
+    def execute(self, sql, parameters=()):
+        start = perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            count_statement(sql, start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            count_statement(sql, start)
+
+    def executescript(self, sql_script):
+        start = perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            count_statement(sql_script, start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """ A connection whose statements, and commits, count towards the current request of the calling thread
+
+    Connection.execute and friends create their cursor in C, without going through cursor(), so they are timed here too.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        start = perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            count_statement(sql, start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            count_statement(sql, start)
+
+    def executescript(self, sql_script):
+        start = perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            count_statement(sql_script, start)
+
+    def commit(self):
+        start = perf_counter()
+        try:
+            super().commit()
+        finally:
+            seconds = perf_counter() - start
+            counts = current.counts
+            counts.sql_seconds += seconds
+            if counts.trace is not None:
+                counts.trace.append(("COMMIT", seconds))
+
+
+class RouteStats:
+    __slots__ = ("statuses", "buckets", "recent", "seconds", "response_bytes", "statements", "sql_seconds",
+                 "disk_reads", "cached_reads")
+
+    def __init__(self, buckets: int, window: int):
+        self.statuses = {}
+        # Not cumulative, one more than there are bounds for the +Inf bucket
+        self.buckets = [0] * (buckets + 1)
+        self.recent = deque(maxlen=window)
+        self.seconds = 0.0
+        self.response_bytes = 0
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.disk_reads = 0
+        self.cached_reads = 0
+
+    def copy(self):
+        copy = RouteStats(0, self.recent.maxlen)
+        for name in self.__slots__:
+            setattr(copy, name, getattr(self, name))
+        copy.statuses = dict(self.statuses)
+        copy.buckets = list(self.buckets)
+        copy.recent = list(self.recent)
+        return copy
+
+
+class Metrics:
+    """ Request counts, latencies, response sizes, SQL and rich description reads for each route.
+
+    Everything is kept in memory for this process, so with several worker processes each one is scraped separately.
+    Latency quantiles are computed at scrape time over each route's most recent `window` requests, alongside a
+    histogram over every request.
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, window: int = 1024, caches: dict = None):
+        self.latency_buckets = tuple(latency_buckets)
+        self.window = window
+        # LRUCaches whose stats are reported, by name
+        self.caches = caches if caches is not None else {}
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status: str, seconds: float, size: int, counts: RequestCounts):
+        key = (method, route)
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = RouteStats(len(self.latency_buckets), self.window)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.buckets[bisect_left(self.latency_buckets, seconds)] += 1
+            stats.recent.append(seconds)
+            stats.seconds += seconds
+            stats.response_bytes += size
+            stats.statements += counts.statements
+            stats.sql_seconds += counts.sql_seconds
+            stats.disk_reads += counts.disk_reads
+            stats.cached_reads += counts.cached_reads
+
+    def render(self) -> str:
+        """ Every metric in the Prometheus text exposition format """
+        with self._lock:
+            routes = [(method, route, stats.copy()) for (method, route), stats in sorted(self._routes.items())]
+        lines = []
+
+        def family(name, kind, help):
+            lines.append(f"# HELP lorelog_{name} {help}")
+            lines.append(f"# TYPE lorelog_{name} {kind}")
+
+        def sample(name, labels, value):
+            labels = ",".join(f'{label}="{escape(label_value)}"' for label, label_value in labels)
+            lines.append(f"lorelog_{name}{{{labels}}} {format_value(value)}")
+
+        family("requests_total", "counter", "Requests handled, by route and status")
+        for method, route, stats in routes:
+            for status, count in sorted(stats.statuses.items()):
+                sample("requests_total", (("method", method), ("route", route), ("status", status)), count)
+
+        family("request_duration_seconds", "histogram", "Time to handle each request, including streaming its body")
+        for method, route, stats in routes:
+            count = 0
+            for bound, bucket in zip(self.latency_buckets + (float("inf"),), stats.buckets):
+                count += bucket
+                sample("request_duration_seconds_bucket",
+                       (("method", method), ("route", route), ("le", format_value(bound))), count)
+            sample("request_duration_seconds_sum", (("method", method), ("route", route)), stats.seconds)
+            sample("request_duration_seconds_count", (("method", method), ("route", route)), count)
+
+        family("request_latency_seconds", "summary", f"Latency quantiles over the last {self.window} requests")
+        for method, route, stats in routes:
+            recent = sorted(stats.recent)
+            for quantile in QUANTILES:
+                sample("request_latency_seconds", (("method", method), ("route", route), ("quantile", quantile)),
+                       recent[min(len(recent) - 1, int(len(recent) * quantile))])
+            sample("request_latency_seconds_sum", (("method", method), ("route", route)), sum(recent))
+            sample("request_latency_seconds_count", (("method", method), ("route", route)), len(recent))
+
+        for name, attribute, kind, help in (
+                ("response_bytes_total", "response_bytes", "counter", "Bytes of response bodies"),
+                ("sql_statements_total", "statements", "counter", "SQL statements executed"),
+                ("sql_seconds_total", "sql_seconds", "counter", "Time spent executing SQL statements and commits")):
+            family(name, kind, help)
+            for method, route, stats in routes:
+                sample(name, (("method", method), ("route", route)), getattr(stats, attribute))
+
+        family("rich_description_reads_total", "counter", "Rich description files read, from the cache or from disk")
+        for method, route, stats in routes:
+            sample("rich_description_reads_total", (("method", method), ("route", route), ("source", "cache")),
+                   stats.cached_reads)
+            sample("rich_description_reads_total", (("method", method), ("route", route), ("source", "disk")),
+                   stats.disk_reads)
+
+        cache_stats = {name: cache.stats() for name, cache in sorted(self.caches.items())}
+        for stat, kind, help in (("entries", "gauge", "Entries in each cache"),
+                                 ("size", "gauge", "Size of each cache, in entries or bytes"),
+                                 ("hits", "counter", "Cache hits"),
+                                 ("misses", "counter", "Cache misses"),
+                                 ("evictions", "counter", "Entries evicted to make room")):
+            name = f"cache_{stat}" if kind == "gauge" else f"cache_{stat}_total"
+            family(name, kind, help)
+            for cache, values in cache_stats.items():
+                sample(name, (("cache", cache),), values[stat])
+        return "\n".join(lines) + "\n"
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsMiddleware:
+    """ Records every request in a Metrics. Should come first, so that it also times the other middleware """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def process_request(self, req: falcon.Request, res: falcon.Response):
+        counts = current.counts = RequestCounts()
+        req.context["metrics"] = (perf_counter(), counts)
+
+    def process_response(self, req: falcon.Request, res: falcon.Response, resource, req_succeeded: bool):
+        start, counts = req.context.get("metrics", (None, None))
+        if start is None:
+            return
+        route = req.uri_template or "unmatched"
+        status = res.status[:3]
+        stream = res.stream
+        if stream is not None and not hasattr(stream, "read"):
+            # Only recorded once the body has been streamed, which is when its queries run and its size is known
+            res.stream = self._measured(stream, req.method, route, status, start, counts)
+            return
+        body = res.body
+        if body is not None:
+            size = len(body.encode())
+        else:
+            body = res.data
+            size = len(body) if body is not None else 0
+        self.metrics.record(req.method, route, status, perf_counter() - start, size, counts)
+
+    def _measured(self, stream, method: str, route: str, status: str, start: float, counts: RequestCounts):
+        size = 0
+        try:
+            for chunk in stream:
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.metrics.record(method, route, status, perf_counter() - start, size, counts)
+
+
+class MetricsResource:
+    """ Serves a Metrics for Prometheus to scrape """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def on_get(self, req: falcon.Request, res: falcon.Response):
+        res.content_type = "text/plain; version=0.0.4; charset=utf-8"
+        res.body = self.metrics.render()
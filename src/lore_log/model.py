@@ -1,9 +1,44 @@
 import sqlite3
-from abc import ABC
+from abc import ABCMeta
 import falcon
 
+# The types of value sqlite can bind, which are all a row's fields may hold
+scalar_types = (str, int, float, type(None))
 
-class Model(ABC):
+
+def first_free_id(c: sqlite3.Cursor, table: str) -> int:
+    """ The lowest id above every id a table has ever used, including those of deleted rows """
+    return c.execute(f"""
+    SELECT max(coalesce((SELECT max([id]) FROM [{table}]), 0),
+               coalesce((SELECT [seq] FROM sqlite_sequence WHERE [name] = ?), 0)) + 1
+    """, (table,)).fetchone()[0]
+
+
+class ModelMeta(ABCMeta):
+    """ Gives every model class empty `__slots__` unless it declares its own, so instances have no `__dict__` """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        namespace.setdefault("__slots__", ())
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+
+def _field_property(index: int) -> property:
+    def get(self):
+        return self._values[index]
+
+    def set(self, value):
+        self._values[index] = value
+    return property(get, set)
+
+
+class Model(metaclass=ModelMeta):
+    """ A row of `table_name`, with a value for each of `fields` then each of `extra_fields`.
+
+    Everything derived from the class attributes below (field names and indexes, columns and SQL) is compiled once when a
+    subclass is defined, rather than for every instance. Instances only hold a list of values,
+    read and written through a property per field.
+    """
+    __slots__ = ("_values",)
 
     fields = []
     # Used for storing values that have a different db column name than is used in json representation
@@ -14,66 +49,83 @@ class Model(ABC):
     extra_fields = set()
     # Used to get a subset of fields for returning results in List views (GET without an id)
     summary_fields = set()
+    # Text fields indexed for full text search, the first of which is the entity's name. Empty if not searchable.
+    search_fields = []
     autoincrement_id = True
     table_name = ""
     exception_map = {}
 
-    def __init__(self, **kwargs):
-        for key in self.alias_fields.keys():
-            if key not in self.fields and key not in self.extra_fields:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for key in cls.alias_fields.keys():
+            if key not in cls.fields and key not in cls.extra_fields:
                 raise ValueError("Invalid alias_field value: {} does not exist in class fields".format(key))
+        cls.field_names = tuple(cls.fields) + tuple(sorted(cls.extra_fields))
+        cls.summary_names = tuple(name for name in cls.field_names if name in cls.summary_fields)
+        cls._index = {name: i for i, name in enumerate(cls.field_names)}
+        cls._summary = tuple((name, cls._index[name]) for name in cls.summary_names)
+        cls._columns = [f"[{cls.alias_fields.get(field, field)}]" for field in cls.fields]
+        cls.select_sql = "SELECT {} FROM [{}]".format(",".join(cls._columns), cls.table_name)
+        # INSERT and UPDATE statements only set non-null columns, so are cached by which columns those are
+        cls._insert_sql = {}
+        cls._update_sql = {}
+        for i, name in enumerate(cls.field_names):
+            setattr(cls, name, _field_property(i))
 
-        self._kvs = {}
-        for each in self.fields + list(self.extra_fields):
-            self._kvs[each] = None
+    def __init__(self, **kwargs):
+        self._values = [None] * len(self.field_names)
         for k, v in kwargs.items():
-            if k in self.fields or k in self.extra_fields:
-                self._kvs[k] = v
-            else:
+            i = self._index.get(k)
+            if i is None:
                 raise NameError("Invalid field name {}".format(k))
-
-    def __getattr__(self, item):
-        return self._kvs[item]
-
-    def __setattr__(self, key, value):
-        if key in self.fields or key in self.extra_fields:
-            self._kvs[key] = value
-        else:
-            super().__setattr__(key, value)
+            self._values[i] = v
 
     @classmethod
     def has_external_file_name(cls):
         return "external_file_name" in cls.fields
 
+    @classmethod
+    def columns(cls) -> list:
+        """ The bracket-quoted db column for each of `fields`, in order """
+        return cls._columns
+
+    @classmethod
+    def column(cls, name: str, table: str = None) -> str:
+        """ The bracket-quoted db column of a field, qualified by `table` if given """
+        column = f"[{cls.alias_fields.get(name, name)}]"
+        return f"{table}.{column}" if table else column
+
     @classmethod
     def from_db(cls, row):
-        kvs = {}
-        for i, each in enumerate(row):
-            kvs[cls.fields[i]] = each
-        return cls(**kvs)
+        model = cls.__new__(cls)
+        values = list(row)
+        values += [None] * (len(cls.field_names) - len(values))
+        model._values = values
+        return model
 
     @classmethod
     def from_media(cls, data: dict):
         return cls(**data)
 
     @classmethod
-    def from_req(cls, req: falcon.Request):
-        c = cls(**req.media)
+    def from_req(cls, req: falcon.Request, data: dict = None):
+        """ Builds a model from the request body, or from `data` (e.g. one item of a bulk request) if given """
+        c = cls(**(req.media if data is None else data))
         if "campaign_id" in c.fields:
             c.campaign_id = req.context["user"]["campaign"]
         if "creator_id" in c.fields:
             c.creator_id = req.context["user"]["id"]
         return c
 
-    def to_dict(self) -> dict:
-        return self._kvs
+    def to_dict(self, names=None) -> dict:
+        """ The model's fields and values, or only those of `names` if given """
+        if names is None:
+            return dict(zip(self.field_names, self._values))
+        return {name: self._values[self._index[name]] for name in names}
 
     def to_summary_dict(self) -> dict:
-        d = {}
-        for k, v in self._kvs.items():
-            if k in self.summary_fields:
-                d[k] = v
-        return d
+        values = self._values
+        return {name: values[i] for name, i in self._summary}
 
     def execute_sql(self, c: sqlite3.Cursor, sql: str, args):
         try:
@@ -84,32 +136,73 @@ class Model(ABC):
             else:
                 raise e
 
-    def select_fields(self, index=0):
-        columns = []
-        for each in self.fields[index:]:
-            if self._kvs[each] is None:
-                continue
-            if each in self.alias_fields:
-                each = self.alias_fields[each]
-            columns.append("[" + each + "]")
-        return columns
+    def _present(self, start: int) -> tuple:
+        """ The indexes of the non-null fields from `start` on """
+        values = self._values
+        return tuple(i for i in range(start, len(self.fields)) if values[i] is not None)
+
+    def insert_statement(self, start: int = 0):
+        """ The INSERT statement and its args for the non-null fields from `start` on """
+        present = self._present(start)
+        sql = self._insert_sql.get(present)
+        if sql is None:
+            sql = self._insert_sql[present] = "INSERT INTO [{}] ({}) VALUES ({})".format(
+                self.table_name, ",".join(self._columns[i] for i in present), ",".join(["?"] * len(present)))
+        return sql, [self._values[i] for i in present]
+
+    def update_statement(self):
+        """ The UPDATE statement and its args, setting every non-null field of the row with this model's id """
+        present = self._present(1)
+        sql = self._update_sql.get(present)
+        if sql is None:
+            sql = self._update_sql[present] = "UPDATE [{}] SET {} WHERE {}=?".format(
+                self.table_name, ",".join(f"{self._columns[i]}=?" for i in present), self._columns[0])
+        return sql, [self._values[i] for i in present] + [self._values[0]]
+
+    @classmethod
+    def insert_many(cls, db: sqlite3.Connection, models: list) -> dict:
+        """ Inserts models with one executemany per set of non-null columns, within the caller's transaction
+
+        Autoincrement ids are allocated up front, so they are known without a lastrowid per row. If a batch fails, it is
+        retried a row at a time to find the models at fault, which are left out. Returns the errors of those models by
+        their index in `models`, mapped through `exception_map` where possible.
+        """
+        c = db.cursor()
+        if cls.autoincrement_id:
+            next_id = first_free_id(c, cls.table_name)
+            for i, model in enumerate(models):
+                model._values[0] = next_id + i
+        groups = {}
+        for i, model in enumerate(models):
+            sql, args = model.insert_statement()
+            indexes, rows = groups.setdefault(sql, ([], []))
+            indexes.append(i)
+            rows.append(args)
+
+        errors = {}
+        for sql, (indexes, rows) in groups.items():
+            c.execute("SAVEPOINT insert_many")
+            try:
+                c.executemany(sql, rows)
+            except sqlite3.Error:
+                c.execute("ROLLBACK TO insert_many")
+                for i, row in zip(indexes, rows):
+                    try:
+                        c.execute(sql, row)
+                    except sqlite3.Error as e:
+                        errors[i] = cls.exception_map.get(type(e)) or falcon.HTTPBadRequest(title=str(e))
+            c.execute("RELEASE insert_many")
+        return errors
 
     def insert(self, db: sqlite3.Connection):
         c = db.cursor()
-        columns = self.select_fields(1 if self.autoincrement_id else 0)
-        values = ",".join(["?"] * len(columns))
-        columns = ",".join(columns)
-        sql = f"INSERT INTO {self.table_name} ({columns}) VALUES ({values})"
-        self.execute_sql(c, sql, [self._kvs[each] for each in self.fields if self._kvs[each] is not None])
+        self.execute_sql(c, *self.insert_statement(1 if self.autoincrement_id else 0))
         if self.autoincrement_id:
-            self._kvs[self.fields[0]] = c.lastrowid
+            self._values[0] = c.lastrowid
 
     def update(self, db: sqlite3.Connection):
         c = db.cursor()
-        columns = [f"{field}=?" for field in self.select_fields(1)]
-        columns = ",".join(columns)
-        sql = f"UPDATE [{self.table_name}] SET {columns} WHERE [{self.fields[0]}]=?"
-        self.execute_sql(c, sql, [self._kvs[each] for each in self.fields[1:] if self._kvs[each] is not None] + [self._kvs[self.fields[0]]])
+        self.execute_sql(c, *self.update_statement())
 
 
 class Relation:
@@ -125,26 +218,38 @@ class Relation:
         instance = self.model.from_req(req)
         self.model = instance  # This is probably a bad idea... but for now idc since this is all pretty rough
 
-    def find_all(self, db: sqlite3.Connection, req: falcon.Request, column: str, id: str):
+    def find_all(self, db: sqlite3.Connection, req: falcon.Request, column: str, id: str) -> list:
+        """ Finds every relation where `column` is `id`, hydrated with the id and name of the entity on the other side
+
+        The related entity's name is joined in the same query, rather than looked up for each relation.
+        """
         c = db.cursor()
         this_id = self.this.table_name + "_id"
         that_id = self.that.table_name + "_id"
+        related, related_id = (self.that, that_id) if column == this_id else (self.this, this_id)
         user = req.context['user']['id']
         qualified_fields = [self.model.table_name + "." + each for each in self.model.fields]
         # In short, to see a relation table entry, the entry must be public, or the user must own BOTH sides
         # TODO allow DMs to see everything
-        sql = f"""SELECT {','.join(qualified_fields)} FROM {self.map_table_name}
+        sql = f"""SELECT {','.join(qualified_fields)}, {related.table_name}.name FROM {self.map_table_name}
         JOIN {self.this.table_name} ON {self.this.table_name}.id = {self.model.table_name}.{this_id}
         JOIN {self.that.table_name} ON {self.that.table_name}.id = {self.model.table_name}.{that_id}
         WHERE {self.model.table_name}.{column}=? AND ({self.model.table_name}.is_public = 1 
         OR ({self.this.table_name}.creator_id = ? AND {self.that.table_name}.creator_id = ?))"""
-        rows = c.execute(sql, (id, user, user)).fetchall()
-        return rows
+        num_fields = len(self.model.fields)
+        models = []
+        for row in c.execute(sql, (id, user, user)):
+            model = self.model.from_db(row[:num_fields])
+            model.primary_id = id
+            model.relation_id = getattr(model, related_id)
+            model.relation_name = row[num_fields]
+            models.append(model)
+        return models
 
     def add(self, db: sqlite3.Connection):
         c = db.cursor()
         columns = [f"[{field}]" for field in self.model.fields]
         values = ",".join(["?"] * len(columns))
         columns = ",".join(columns)
-        args = [self.model._kvs[each] for each in self.model.fields]
+        args = [getattr(self.model, each) for each in self.model.fields]
         c.execute(f"INSERT INTO {self.map_table_name} ({columns}) VALUES ({values})", args)
@@ -0,0 +1,83 @@
+import base64
+import json
+import falcon
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+def encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+
+def decode_cursor(token: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        raise falcon.HTTPBadRequest(title="invalid pagination cursor")
+    # Cursor values are bound as sql parameters, so anything else would only fail in sqlite
+    if not isinstance(values, list) or not all(each is None or isinstance(each, (str, int, float)) for each in values):
+        raise falcon.HTTPBadRequest(title="invalid pagination cursor")
+    return values
+
+
+class Page:
+    """ Keyset pagination over a collection query, driven by the `limit` and `cursor` query params.
+
+    `columns` are the sql expressions the collection is ordered by. They must end in a unique column (typically the
+    id), so the last row of a page identifies exactly where the next page starts. Requests without `limit` or `cursor`
+    are not paginated, and get the whole (ordered) collection as before.
+    """
+
+    def __init__(self, req: falcon.Request, columns: tuple, descending: bool = False):
+        self.columns = columns
+        self.descending = descending
+        self.limit = req.get_param_as_int("limit", min_value=1, max_value=MAX_LIMIT)
+        cursor = req.get_param("cursor")
+        self.after = decode_cursor(cursor) if cursor else None
+        if self.after is not None and len(self.after) != len(columns):
+            raise falcon.HTTPBadRequest(title="invalid pagination cursor")
+        if self.after is not None and self.limit is None:
+            self.limit = DEFAULT_LIMIT
+
+    @property
+    def predicate(self) -> str:
+        """ The sql condition selecting rows after the cursor, to be AND-ed onto the query's WHERE clause """
+        if self.after is None:
+            return ""
+        return " AND ({}) {} ({})".format(",".join(self.columns), "<" if self.descending else ">",
+                                          ",".join(["?"] * len(self.columns)))
+
+    @property
+    def args(self) -> list:
+        return list(self.after) if self.after is not None else []
+
+    @property
+    def order_by(self) -> str:
+        return ",".join(f"{column} DESC" if self.descending else column for column in self.columns)
+
+    @property
+    def limit_clause(self) -> str:
+        # One extra row is fetched to find out whether there is a next page
+        return f"LIMIT {self.limit + 1}" if self.limit is not None else ""
+
+    def select(self, columns) -> tuple:
+        """ Adds whichever of the ordering columns are missing from `columns`, so every row has its cursor values.
+
+        Returns the columns to select, and a key that maps a row to its values for the ordering columns.
+        """
+        columns = list(columns)
+        columns += [each for each in self.columns if each not in columns]
+        positions = [columns.index(each) for each in self.columns]
+        return columns, lambda row: tuple(row[i] for i in positions)
+
+    def trim(self, rows, res: falcon.Response, key):
+        """ Cuts the extra row off a page of rows, and sets the X-Next-Cursor header if there is another page.
+
+        `key` maps a row to its values for `columns`. Unpaginated rows are all returned.
+        """
+        rows = rows.fetchall() if hasattr(rows, "fetchall") else list(rows)
+        if self.limit is not None and len(rows) > self.limit:
+            rows = rows[:self.limit]
+            res.set_header("X-Next-Cursor", encode_cursor(key(rows[-1])))
+        return rows
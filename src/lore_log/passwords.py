@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import threading
+import falcon
+import bcrypt
+import os
+
+
+class PasswordHasher:
+    """ Hashes and checks passwords with bcrypt on a small, bounded pool of worker threads.
+
+    bcrypt is deliberately slow, so running it on the threads serving requests lets a few concurrent logins stall every
+    other call. Here at most `workers` hashes run at once, at most `max_queue` more wait for a worker, and any beyond
+    that are rejected straight away with a 503 rather than queueing behind them.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 16, rounds: int = 12, timeout: float = 10.0):
+        self.workers = workers
+        self.rounds = rounds
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Threads don't survive a fork, so each worker process starts its own pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="bcrypt")
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise falcon.HTTPServiceUnavailable(title="Too many logins in progress, please try again", retry_after=1)
+        try:
+            future = self._pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise falcon.HTTPServiceUnavailable(title="Too many logins in progress, please try again", retry_after=1)
+
+    def hash(self, password: str) -> bytes:
+        return self._run(lambda: bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.rounds)))
+
+    def check(self, password: str, hashed: bytes) -> bool:
+        return self._run(bcrypt.checkpw, password.encode(), hashed)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
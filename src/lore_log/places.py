@@ -1,13 +1,14 @@
 from .resource import Resource
 import falcon
 from .model import Model
-import os
+from .pagination import Page
 
 
 class PlaceModel(Model):
     fields = ["id", "name", "type", "map_url", "description", "external_file_name", "is_public", "campaign_id", "creator_id"]
     extra_fields = {"rich_description"}
     summary_fields = {"id", "name", "type", "description", "is_public"}
+    search_fields = ["name", "description"]
     table_name = "place"
     autoincrement_id = True
 
@@ -15,14 +16,21 @@ class PlaceModel(Model):
 valid_types = {"domain", "region", "city", "dungeon"}
 
 
+def validate_place(place: PlaceModel):
+    if place.type not in valid_types:
+        raise falcon.HTTPBadRequest(title="Invalid place type. Must be domain, region, city or dungeon")
+    if place.type == "domain":
+        raise falcon.HTTPBadRequest(title="Cannot create multiple domains in a campaign")
+
+
 class Places(Resource):
+    cache_responses = True
 
     def on_post(self, req: falcon.Request, res: falcon.Response):
+        if isinstance(req.media, list):
+            return self.create_many(PlaceModel, req, res, validate_place)
         place = PlaceModel.from_req(req)
-        if place.type not in valid_types:
-            raise falcon.HTTPBadRequest(title="Invalid place type. Must be domain, region, city or dungeon")
-        if place.type == "domain":
-            raise falcon.HTTPBadRequest(title="Cannot create multiple domains in a campaign")
+        validate_place(place)
         self.create(place, res)
 
     def on_get(self, req: falcon.Request, res: falcon.Response):
@@ -31,32 +39,30 @@ class Places(Resource):
         if req.params.get("type", None) is not None:
             where += " AND [type] = ?"
             where_args.append(req.params.get("type"))
-        c = self._db.cursor()
-        rows = c.execute("""SELECT {} FROM [place] {}""".format(
-            ", ".join(f"[{field}]" for field in PlaceModel.fields), where), where_args).fetchall()
-        places = []
-        for row in rows:
-            places.append(PlaceModel.from_db(row).to_summary_dict())
-        res.media = places
+        names = self.requested_fields(req, PlaceModel.summary_names)
+        page = Page(req, ("[name]", "[id]"))
+        columns, key = page.select(PlaceModel.column(each) for each in names)
+        c = self._read_db.cursor()
+        rows = c.execute("""SELECT {} FROM [place] {}{} ORDER BY {} {}""".format(
+            ", ".join(columns), where, page.predicate, page.order_by, page.limit_clause), where_args + page.args)
+        self.send_collection(req, res, rows, page, key, lambda row: dict(zip(names, row)))
 
 
 class Place(Resource):
 
     def on_get(self, req: falcon.Request, res: falcon.Response, place_id):
         """ GET a single place """
-        c = self._db.cursor()
-        row = c.execute("""
-         SELECT {}
-         FROM place
-         WHERE id=? AND (creator_id=? OR is_public=1)
-         """.format(",".join(f"[{field}]" for field in PlaceModel.fields)), (place_id, req.context['user']['id'])).fetchone()
+        c = self._read_db.cursor()
+        row = c.execute(PlaceModel.select_sql + " WHERE id=? AND (creator_id=? OR is_public=1)",
+                        (place_id, req.context['user']['id'])).fetchone()
         if not row:
             raise falcon.HTTPNotFound(title="No place found with id {} or unauthorized".format(place_id))
+        self.check_not_modified(req, res, self.detail_etag(req, PlaceModel, row))
+        names = self.requested_fields(req, PlaceModel.field_names)
         place = PlaceModel.from_db(row)
-        if place.external_file_name:
-            with open(os.path.join(self._path, place.external_file_name)) as f:
-                place.rich_description = f.read()
-        res.media = place.to_dict()
+        if place.external_file_name and "rich_description" in names:
+            place.rich_description = self.read_rich_description(place.external_file_name)
+        res.media = place.to_dict(names)
 
     def on_patch(self, req: falcon.Request, res: falcon.Response, place_id):
         self.update(PlaceModel, req, place_id)
@@ -0,0 +1,112 @@
+from .metrics import current
+from collections import deque, Counter
+from itertools import count
+import threading
+import logging
+import falcon
+import time
+import re
+
+# String and numeric literals, which are replaced by placeholders so that statements differing only by them match
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Lists of placeholders, e.g. from `IN (?, ?, ?)`, which are collapsed as their length varies
+_placeholder_lists = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def normalize(sql: str) -> str:
+    """ The shape of a statement, with literals replaced by placeholders and whitespace collapsed """
+    return " ".join(_placeholder_lists.sub("?", _literals.sub("?", sql)).split())
+
+
+class SqlProfiler:
+    """ Captures every SQL statement each request runs, with its timing, for profiling against realistic data.
+
+    Statements slower than `slow_query_ms` are logged as they are found, as are requests that run the same normalized
+    statement more than `repeat_threshold` times, which is usually a query per row that should be a join (N+1). The
+    last `keep` profiles are kept for the debug endpoint, and each response says which one is its own in a header.
+
+    Statements are captured by the connections' TimedConnection, so they only include what runs before the response is
+    handed back, and not the queries of a streamed body.
+    """
+
+    header = "X-SQL-Profile"
+
+    def __init__(self, slow_query_ms: float = 100, repeat_threshold: int = 10, keep: int = 100):
+        self.slow_query_ms = slow_query_ms
+        self.repeat_threshold = repeat_threshold
+        self._profiles = deque(maxlen=keep)
+        self._ids = count(1)
+        self._lock = threading.Lock()
+
+    def start(self):
+        current.counts.trace = []
+
+    def finish(self, method: str, path: str) -> dict:
+        """ Builds, logs and keeps the profile of the calling thread's request """
+        trace = current.counts.trace or []
+        current.counts.trace = None
+        statements = [{"sql": " ".join(sql.split()), "ms": round(seconds * 1000, 3)} for sql, seconds in trace]
+        slow = [each for each in statements if each["ms"] >= self.slow_query_ms]
+        repeats = Counter(normalize(sql) for sql, _ in trace)
+        repeated = [{"sql": sql, "count": times} for sql, times in repeats.most_common()
+                    if times > self.repeat_threshold]
+        profile = {
+            "id": next(self._ids),
+            "time": time.time(),
+            "method": method,
+            "path": path,
+            "statements": len(statements),
+            "ms": round(sum(seconds for _, seconds in trace) * 1000, 3),
+            "slow": slow,
+            "repeated": repeated,
+            "trace": statements,
+        }
+        for each in slow:
+            logging.warning("Slow query on {} {} ({}ms): {}".format(method, path, each["ms"], each["sql"]))
+        for each in repeated:
+            logging.warning("Possible N+1 on {} {}, the same statement ran {} times: {}".format(
+                method, path, each["count"], each["sql"]))
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    def profiles(self) -> list:
+        """ The kept profiles, most recent first """
+        with self._lock:
+            return list(reversed(self._profiles))
+
+
+class SqlProfilerMiddleware:
+    """ Profiles every request. Must come after MetricsMiddleware, which starts each request's counts """
+
+    def __init__(self, profiler: SqlProfiler):
+        self.profiler = profiler
+
+    def process_request(self, req: falcon.Request, res: falcon.Response):
+        self.profiler.start()
+
+    def process_response(self, req: falcon.Request, res: falcon.Response, resource, req_succeeded: bool):
+        if req.path.startswith("/debug/sql"):
+            current.counts.trace = None
+            return
+        profile = self.profiler.finish(req.method, req.relative_uri)
+        res.set_header(self.profiler.header, "id={}; statements={}; ms={}; slow={}; repeated={}".format(
+            profile["id"], profile["statements"], profile["ms"], len(profile["slow"]), len(profile["repeated"])))
+
+
+class SqlProfiles:
+    """ Serves the kept profiles, or a single one by the id given in its response's header """
+
+    def __init__(self, profiler: SqlProfiler):
+        self.profiler = profiler
+
+    def on_get(self, req: falcon.Request, res: falcon.Response, profile_id=None):
+        profiles = self.profiler.profiles()
+        if profile_id is None:
+            res.media = profiles
+            return
+        for profile in profiles:
+            if str(profile["id"]) == profile_id:
+                res.media = profile
+                return
+        raise falcon.HTTPNotFound(title=f"no profile with id {profile_id} is kept")
@@ -1,49 +1,252 @@
 import sqlite3 as sqlite
-from .model import Model
+from .db import Database
+from .cache import FileCache
+from .model import Model, scalar_types
+from .pagination import Page
+from .fts import index_document
 from .utils import generate_new_id
 import falcon
 from typing import ClassVar
-from os import remove, path
+from os import path, stat
+from itertools import chain
+import hashlib
+import json
 
 
 class Resource:
+    # Unpaginated collections with at least this many rows are streamed rather than built in memory
+    stream_threshold = 1000
+    # Streamed JSON is written in chunks of about this many bytes
+    stream_chunk_size = 64 * 1024
+    # Bulk creates of more items than this are rejected
+    max_batch_size = 500
+    # Whether GET responses may be served from the ResponseCache until the campaign next changes
+    cache_responses = False
 
-    def __init__(self, db: sqlite.Connection, data_path: str):
-        self._db = db
+    def __init__(self, db: Database, data_path: str, file_cache: FileCache = None):
+        self._database = db
         self._path = data_path
+        self._files = file_cache if file_cache is not None else FileCache()
+
+    @property
+    def _read_db(self) -> sqlite.Connection:
+        """ The calling thread's read-only connection, which never waits on writers """
+        return self._database.read_connection()
+
+    def transaction(self):
+        """ A transaction scope on the read-write connection. Each request's writes should be exactly one scope """
+        return self._database.transaction()
+
+    @staticmethod
+    def bump_campaign_version(db: sqlite.Connection, campaign_id):
+        """ Marks the campaign as changed, so that responses cached from before this write are no longer used """
+        db.execute("UPDATE [campaign] SET [version] = [version] + 1 WHERE [id] = ?", (campaign_id,))
+
+    @staticmethod
+    def requested_fields(req: falcon.Request, available) -> list:
+        """ The `available` fields narrowed to those named by the `fields` query param, if it is given.
+
+        e.g. `?fields=id,name` or `?fields=id&fields=name`
+        """
+        requested = [name for each in req.get_param_as_list("fields") or () for name in each.split(",") if name]
+        if not requested:
+            return list(available)
+        unknown = set(requested).difference(available)
+        if unknown:
+            raise falcon.HTTPBadRequest(title="Unknown fields: {}".format(", ".join(sorted(unknown))))
+        return [each for each in available if each in requested]
+
+    def read_rich_description(self, file_name: str) -> str:
+        return self._files.read(path.join(self._path, file_name))
+
+    def write_rich_description(self, file_name: str, text: str):
+        # Written through the cache, so the next read of a fresh edit is a hit
+        self._files.write(path.join(self._path, file_name), text)
+
+    def create_rich_description(self, text: str) -> str:
+        """ Writes a new rich description file, which is removed again if the current transaction rolls back """
+        file_name = generate_new_id()
+        self.write_rich_description(file_name, text)
+        self._database.after_rollback(lambda: self.remove_rich_description(file_name))
+        return file_name
+
+    def remove_rich_description(self, file_name: str):
+        self._files.remove(path.join(self._path, file_name))
+
+    def rich_description_version(self, file_name: str):
+        """ Identifies the current contents of a rich description file without reading it """
+        if not file_name:
+            return None
+        try:
+            file_stat = stat(path.join(self._path, file_name))
+        except FileNotFoundError:
+            return None
+        return file_stat.st_mtime_ns, file_stat.st_size
+
+    @staticmethod
+    def etag(req: falcon.Request, *parts) -> str:
+        """ A strong ETag over the data a representation is built from.
+
+        Representations differ by who is asking (e.g. private fields are only shown to their creator), so the
+        requesting user is always part of the tag.
+        """
+        return hashlib.blake2b(repr((req.context["user"]["id"],) + parts).encode(), digest_size=16).hexdigest()
+
+    def detail_etag(self, req: falcon.Request, model: ClassVar, row) -> str:
+        """ The ETag of a single resource, from its row of `model.fields` and its rich description file """
+        file_name = row[model.fields.index("external_file_name")] if model.has_external_file_name() else None
+        return self.etag(req, model.table_name, tuple(row), self.rich_description_version(file_name))
+
+    @staticmethod
+    def check_not_modified(req: falcon.Request, res: falcon.Response, etag: str):
+        """ Sets the response ETag, and short-circuits with a 304 if the client already has this representation.
+
+        Handlers call this as soon as they have the data their response depends on, and before any expensive work like
+        reading a rich description file or serializing a collection.
+        """
+        res.etag = etag
+        if req.if_none_match and ("*" in req.if_none_match or etag in req.if_none_match):
+            raise falcon.HTTPStatus(falcon.HTTP_NOT_MODIFIED)
+
+    def send_collection(self, req: falcon.Request, res: falcon.Response, rows, page: Page, key, to_dict):
+        """ Responds with a JSON array of `to_dict(row)` for each row of a collection query.
+
+        Pages and small collections are built in memory, and get an ETag. Unpaginated collections requested with
+        `?stream=1`, or of at least `stream_threshold` rows, are instead serialized incrementally while iterating the
+        cursor, so memory use doesn't grow with the collection. `?stream=0` disables streaming.
+        """
+        stream = req.get_param_as_bool("stream")
+        if page.limit is None and stream is not False:
+            head = rows.fetchmany(self.stream_threshold)
+            if stream or len(head) == self.stream_threshold:
+                res.content_type = falcon.MEDIA_JSON
+                res.stream = self._stream_json(chain(head, rows), to_dict)
+                return
+            rows = head
+        rows = page.trim(rows, res, key)
+        self.check_not_modified(req, res, self.etag(req, type(self).__name__, rows))
+        res.media = [to_dict(row) for row in rows]
+
+    def _stream_json(self, rows, to_dict):
+        chunk = ["["]
+        size = 1
+        for i, row in enumerate(rows):
+            item = json.dumps(to_dict(row), ensure_ascii=False)
+            chunk.append("," + item if i else item)
+            size += len(item) + 1
+            if size >= self.stream_chunk_size:
+                yield "".join(chunk).encode()
+                chunk = []
+                size = 0
+        chunk.append("]")
+        yield "".join(chunk).encode()
 
     def create(self, model: Model, res: falcon.Response):
-        if model.has_external_file_name() and model.rich_description:
-            model.external_file_name = generate_new_id()
-            with open(path.join(self._path, model.external_file_name), "w") as f:
-                f.write(model.rich_description)
-        model.insert(self._db)
-        self._db.commit()
+        with self.transaction() as db:
+            if model.has_external_file_name() and model.rich_description:
+                model.external_file_name = self.create_rich_description(model.rich_description)
+            model.insert(db)
+            self.bump_campaign_version(db, model.campaign_id)
+            values = model.to_dict()
+            index_document(db, type(model), values[model.fields[0]], values.get("rich_description"))
         res.media = model.to_dict()
         res.status = falcon.HTTP_201
 
+    def create_many(self, model: ClassVar, req: falcon.Request, res: falcon.Response, validate=None):
+        """ Creates every item of a JSON array body in one transaction, responding with a result for each item.
+
+        A result is `{"status": 201, "item": {...}}` for a created item, or the status and title of the item's error.
+        Items are validated (by `validate`, if given) and inserted independently, so a bad item doesn't stop the rest.
+        The response is 201 if every item was created, and 207 otherwise.
+        """
+        items = req.media
+        if not items or len(items) > self.max_batch_size:
+            raise falcon.HTTPBadRequest(title=f"Expected between 1 and {self.max_batch_size} items")
+        has_file = model.has_external_file_name()
+        results = [None] * len(items)
+        valid = []
+        for i, data in enumerate(items):
+            try:
+                if not isinstance(data, dict):
+                    raise falcon.HTTPBadRequest(title="Expected an object")
+                if not all(isinstance(value, scalar_types) for value in data.values()):
+                    raise falcon.HTTPBadRequest(title="Expected only strings, numbers and nulls as values")
+                if not isinstance(data.get("rich_description") or "", str):
+                    raise falcon.HTTPBadRequest(title="Expected rich_description to be a string")
+                try:
+                    obj = model.from_req(req, data)
+                except NameError as e:
+                    raise falcon.HTTPBadRequest(title=str(e))
+                if validate is not None:
+                    validate(obj)
+            except falcon.HTTPError as e:
+                results[i] = self.item_error(e)
+                continue
+            valid.append((i, obj))
+
+        with self.transaction() as db:
+            # Take the write lock up front, as new ids are allocated from the current max ids
+            if not db.in_transaction:
+                db.execute("BEGIN IMMEDIATE")
+            for _, obj in valid:
+                if has_file and obj.rich_description:
+                    obj.external_file_name = self.create_rich_description(obj.rich_description)
+            errors = model.insert_many(db, [obj for _, obj in valid])
+            if len(errors) < len(valid):
+                self.bump_campaign_version(db, req.context['user']['campaign'])
+            for j, (i, obj) in enumerate(valid):
+                if j in errors:
+                    results[i] = self.item_error(errors[j])
+                    if has_file and obj.external_file_name:
+                        self._database.after_commit(
+                            lambda file_name=obj.external_file_name: self.remove_rich_description(file_name))
+                    continue
+                values = obj.to_dict()
+                index_document(db, model, values[model.fields[0]], values.get("rich_description"))
+                results[i] = {"status": 201, "item": values}
+        res.media = results
+        res.status = falcon.HTTP_201 if all(each["status"] == 201 for each in results) else falcon.HTTP_207
+
+    @staticmethod
+    def item_error(error: falcon.HTTPError) -> dict:
+        """ The result of one item of a bulk request that failed """
+        return {"status": int(error.status.split()[0]), "title": error.title}
+
     def update(self, model: ClassVar, req: falcon.Request, res_id):
+        with self.transaction() as db:
+            self._update(db, model, req, res_id)
+
+    def _update(self, db: sqlite.Connection, model: ClassVar, req: falcon.Request, res_id):
         has_file = model.has_external_file_name()
-        c = self._db.cursor()
-        row = c.execute("SELECT {} FROM {} WHERE creator_id=? AND id=?".format(
-            "[external_file_name]" if has_file else model.fields[0], model.table_name),
-            (req.context['user']['id'], res_id)
-        ).fetchone()
+        c = db.cursor()
+        # Take the write lock before reading the row, so that no other write lands between the If-Match check and ours
+        if not db.in_transaction:
+            c.execute("BEGIN IMMEDIATE")
+        row = c.execute(model.select_sql + " WHERE creator_id=? AND id=?", (req.context['user']['id'], res_id)).fetchone()
 
         if not row:
-            raise falcon.HTTPNotFound("No resource found with id {} or unauthorized".format(res_id))
+            raise falcon.HTTPNotFound(title="No resource found with id {} or unauthorized".format(res_id))
+        # Optimistic concurrency: only update if the client edited the version it was last sent
+        if req.if_match and "*" not in req.if_match:
+            etag = self.detail_etag(req, model, row)
+            if not any(each == etag and not each.is_weak for each in req.if_match):
+                raise falcon.HTTPPreconditionFailed(title="Resource {} has been modified".format(res_id))
 
+        file_name = row[model.fields.index("external_file_name")] if has_file else None
         obj = model.from_req(req)
         if has_file and obj.rich_description:
-            if row[0]:
-                obj.external_file_name = row[0]
+            if file_name:
+                obj.external_file_name = file_name
+                self.write_rich_description(obj.external_file_name, obj.rich_description)
             else:
-                obj.external_file_name = generate_new_id()
-            with open(path.join(self._path, obj.external_file_name), "w") as f:
-                f.write(obj.rich_description)
-        elif has_file and row[0]:
-            # The user deleted all rich description content, so lets delete the file
-            remove(row[0])
+                obj.external_file_name = self.create_rich_description(obj.rich_description)
+        elif has_file and file_name:
+            # The user deleted all rich description content, so lets delete the file once that is committed
+            self._database.after_commit(lambda: self.remove_rich_description(file_name))
             obj.external_file_name = ""
-        obj.update(self._db)
-        self._db.commit()
+        obj.update(db)
+        # Both the campaign the row was in and the one it is now in, which is the user's selected campaign
+        campaigns = {row[model.fields.index("campaign_id")], obj.campaign_id}
+        for campaign_id in campaigns:
+            self.bump_campaign_version(db, campaign_id)
+        index_document(db, model, res_id, obj.to_dict().get("rich_description"))
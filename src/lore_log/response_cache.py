@@ -0,0 +1,58 @@
+from .cache import ResponseCache
+from .db import Database
+import falcon
+
+# Response headers that are part of a cached response
+cached_headers = ("ETag", "X-Next-Cursor")
+
+
+class ResponseCacheMiddleware:
+    """ Serves repeated GETs of resources with `cache_responses` set from a ResponseCache.
+
+    Responses are cached by route, campaign, user and query string, so every user keeps their own view of each page.
+    Each is stored with the version its campaign was at before it was built, and writes bump the version (see
+    Resource.bump_campaign_version), so a cached response is never served once the campaign has changed. The version
+    is read from the database, so a write in one worker process is seen by every other.
+
+    Must come after the auth middleware, as responses are cached per user.
+    """
+
+    def __init__(self, db: Database, cache: ResponseCache):
+        self._database = db
+        self.cache = cache
+
+    def process_resource(self, req: falcon.Request, res: falcon.Response, resource, params):
+        if req.method != "GET" or not getattr(resource, "cache_responses", False):
+            return
+        user = req.context["user"]
+        # Read before the response is built, so a write that lands while building it leaves it stale, not wrong
+        row = self._database.read_connection().execute(
+            "SELECT [version] FROM [campaign] WHERE [id] = ?", (user["campaign"],)).fetchone()
+        version = row[0] if row else None
+        key = (req.path, user["campaign"], user["id"], req.query_string)
+        entry = self.cache.get(key, valid=lambda entry: entry[0] == version)
+        if entry is None:
+            req.context["response_cache"] = (key, version)
+            return
+        _, body, content_type, headers = entry
+        for name, value in headers:
+            res.set_header(name, value)
+        # The ETag header is stored as sent, quoted, while If-None-Match is parsed into unquoted tags
+        etag = res.etag
+        if etag and req.if_none_match and any(each == "*" or each.dumps() == etag for each in req.if_none_match):
+            res.status = falcon.HTTP_NOT_MODIFIED
+        else:
+            res.content_type = content_type
+            res.data = body
+        res.complete = True
+
+    def process_response(self, req: falcon.Request, res: falcon.Response, resource, req_succeeded: bool):
+        pending = req.context.get("response_cache")
+        if pending is None or not req_succeeded or res.status != falcon.HTTP_OK or res.stream is not None:
+            return
+        key, version = pending
+        body = res.data if res.body is None else res.body.encode()
+        if body is None:
+            return
+        headers = tuple((name, res.get_header(name)) for name in cached_headers if res.get_header(name) is not None)
+        self.cache.put(key, (version, body, res.content_type, headers))
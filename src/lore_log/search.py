@@ -0,0 +1,55 @@
+from .resource import Resource
+from .fts import match_query
+from .pagination import DEFAULT_LIMIT, MAX_LIMIT, encode_cursor, decode_cursor
+from .characters import CharacterModel
+from .factions import FactionModel
+from .places import PlaceModel
+from .things import ThingModel
+from .chronicle import ChronicleEntryModel
+import falcon
+
+searchable_models = [CharacterModel, FactionModel, PlaceModel, ThingModel, ChronicleEntryModel]
+
+
+class Search(Resource):
+    """ Ranked full text search over the lore the user can see in their campaign """
+
+    # bm25 weights for the name, description and rich description body columns of lore_search
+    weights = (10.0, 3.0, 1.0)
+
+    def on_get(self, req: falcon.Request, res: falcon.Response):
+        query = match_query(req.get_param("q", required=True))
+        if not query:
+            raise falcon.HTTPBadRequest(title="search query must contain at least one word")
+        limit = req.get_param_as_int("limit", min_value=1, max_value=MAX_LIMIT) or DEFAULT_LIMIT
+        cursor = req.get_param("cursor")
+        # Results are ordered by relevance, which has no stable key to seek to, so pages are offsets
+        after = decode_cursor(cursor) if cursor else [0]
+        if len(after) != 1 or type(after[0]) is not int or after[0] < 0:
+            raise falcon.HTTPBadRequest(title="invalid pagination cursor")
+        offset = after[0]
+        where = "WHERE lore_search MATCH ? AND d.campaign_id = ? AND (d.is_public = 1 OR d.creator_id = ?)"
+        where_args = [query, req.context['user']['campaign'], req.context['user']['id']]
+        types = req.get_param_as_list("type")
+        if types:
+            where += " AND d.entity_type IN ({})".format(",".join(["?"] * len(types)))
+            where_args += types
+        c = self._read_db.cursor()
+        rows = c.execute("""
+        SELECT d.entity_type, d.entity_id, d.name, snippet(lore_search, -1, '', '', '...', 16),
+        bm25(lore_search, {}) AS score
+        FROM lore_search JOIN search_document d ON d.id = lore_search.rowid
+        {}
+        ORDER BY score LIMIT ? OFFSET ?
+        """.format(",".join(str(each) for each in self.weights), where),
+            where_args + [limit + 1, offset]).fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            res.set_header("X-Next-Cursor", encode_cursor([offset + limit]))
+        res.media = [{
+            "type": row[0],
+            "id": row[1],
+            "name": row[2],
+            "snippet": row[3],
+            "score": -row[4]
+        } for row in rows]
@@ -1,7 +1,7 @@
 from .resource import Resource
 from .model import Model
+from .pagination import Page
 import falcon
-import os
 
 
 class ThingModel(Model):
@@ -10,39 +10,43 @@ class ThingModel(Model):
     summary_fields = {"id", "name", "type", "weight", "price", "price_unit", "description"}
     extra_fields = {"rich_description"}
     autoincrement_id = True
+    search_fields = ["name", "description"]
     table_name = "thing"
 
 
 class Things(Resource):
+    cache_responses = True
+
     def on_post(self, req: falcon.Request, res: falcon.Response):
+        if isinstance(req.media, list):
+            return self.create_many(ThingModel, req, res)
         thing = ThingModel.from_req(req)
         self.create(thing, res)
 
     def on_get(self, req: falcon.Request, res: falcon.Response):
-        c = self._db.cursor()
-        rows = c.execute("""SELECT {} FROM [thing] WHERE campaign_id = ? AND (creator_id=? OR is_public=1)""".format(
-            ", ".join(f"[{field}]" for field in ThingModel.fields)),
-            (req.context['user']['campaign'], req.context['user']['id'])).fetchall()
-        things = []
-        for row in rows:
-            things.append(ThingModel.from_db(row).to_summary_dict())
-        res.media = things
+        names = self.requested_fields(req, ThingModel.summary_names)
+        page = Page(req, ("[name]", "[id]"))
+        columns, key = page.select(ThingModel.column(each) for each in names)
+        c = self._read_db.cursor()
+        rows = c.execute("""SELECT {} FROM [thing] WHERE campaign_id = ? AND (creator_id=? OR is_public=1){}
+        ORDER BY {} {}""".format(", ".join(columns), page.predicate, page.order_by, page.limit_clause),
+            [req.context['user']['campaign'], req.context['user']['id']] + page.args)
+        self.send_collection(req, res, rows, page, key, lambda row: dict(zip(names, row)))
 
 
 class Thing(Resource):
     def on_get(self, req: falcon.Request, res: falcon.Response, thing_id):
-        c = self._db.cursor()
-        row = c.execute("""
-        SELECT {} FROM [thing] WHERE id = ? AND (is_public=1 OR creator_id=?)
-        """.format(",".join(f"[{field}]" for field in ThingModel.fields)),
+        c = self._read_db.cursor()
+        row = c.execute(ThingModel.select_sql + " WHERE id = ? AND (is_public=1 OR creator_id=?)",
                         (thing_id, req.context['user']['id'])).fetchone()
         if not row:
             raise falcon.HTTPNotFound(title="No thing found with id {} or unauthorized".format(thing_id))
+        self.check_not_modified(req, res, self.detail_etag(req, ThingModel, row))
+        names = self.requested_fields(req, ThingModel.field_names)
         thing = ThingModel.from_db(row)
-        if thing.external_file_name:
-            with open(os.path.join(self._path, thing.external_file_name)) as f:
-                thing.rich_description = f.read()
-        res.media = thing.to_dict()
+        if thing.external_file_name and "rich_description" in names:
+            thing.rich_description = self.read_rich_description(thing.external_file_name)
+        res.media = thing.to_dict(names)
 
     def on_patch(self, req: falcon.Request, res: falcon.Response, thing_id):
         self.update(ThingModel, req, thing_id)
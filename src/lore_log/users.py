@@ -1,19 +1,28 @@
 import falcon
 from .resource import Resource
 from .utils import generate_new_id, JWT_KEY
+from .cache import ClaimsCache
+from .db import Database
+from .passwords import PasswordHasher
+from .captcha import CaptchaStore, SqliteCaptchaStore
 import sqlite3
-import bcrypt
 import logging
 import jwt
 import datetime
 from string import ascii_lowercase
-from random import choice, randint
-import time
+from random import choice, randint, sample
 
 
 class UsersResource(Resource):
     """ Allows for creating new users and provides methods for authenticating """
 
+    def __init__(self, db: Database, data_path: str, claims_cache: ClaimsCache = None,
+                 password_hasher: PasswordHasher = None, captcha_store: CaptchaStore = None):
+        super().__init__(db, data_path)
+        self._claims_cache = claims_cache if claims_cache is not None else ClaimsCache()
+        self._passwords = password_hasher if password_hasher is not None else PasswordHasher()
+        self._captchas = captcha_store if captcha_store is not None else SqliteCaptchaStore(db)
+
     def on_post(self, req: falcon.Request, res: falcon.Response):
         if not req.media:
             raise falcon.HTTPBadRequest("Bad or missing user payload")
@@ -25,39 +34,39 @@ class UsersResource(Resource):
         if not captcha['id'] or not captcha['answer']:
             raise falcon.HTTPBadRequest("Missing captcha fields. Required id and answer")
 
-        c = self._db.cursor()
-        row = c.execute("SELECT [answer] FROM [captcha_tokens] WHERE id = ?", (captcha["id"],)).fetchone()
-        if row is None:
+        answer = self._captchas.take(captcha["id"])
+        if answer is None:
             raise falcon.HTTPBadRequest("No captcha with id {} found".format(captcha["id"]))
-        c.execute("DELETE FROM [captcha_tokens] WHERE id = ? OR [time] <  date('now', '-1 hour')", (captcha["id"],))
-        self._db.commit()
-        if row[0] != captcha["answer"]:
+        if answer != captcha["answer"]:
             raise falcon.HTTPForbidden("Captcha answer incorrect. Please try again")
 
-        row = c.execute("SELECT [campaign_id] FROM campaign_referral WHERE code=?", (user['code'],)).fetchone()
+        row = self._read_db.execute("SELECT [campaign_id] FROM campaign_referral WHERE code=?",
+                                    (user['code'],)).fetchone()
         if not row:
             raise falcon.HTTPBadRequest("referral code not found")
         campaign_id = row[0]
 
-        hash_pw = bcrypt.hashpw(user['password'].encode(), bcrypt.gensalt())
+        # Hashed before the transaction starts, so the write lock isn't held while bcrypt runs
+        hash_pw = self._passwords.hash(user['password'])
         new_id = generate_new_id()
-        try:
-            c.execute("INSERT INTO [user] ([id], [email], [alias], [password]) VALUES (?, ?, ?, ?)",
-                      (new_id, user['email'], user['alias'], hash_pw))
-        except sqlite3.IntegrityError:
-            raise falcon.HTTPBadRequest("Email already exists")
+        with self.transaction() as db:
+            c = db.cursor()
+            try:
+                c.execute("INSERT INTO [user] ([id], [email], [alias], [password]) VALUES (?, ?, ?, ?)",
+                          (new_id, user['email'], user['alias'], hash_pw))
+            except sqlite3.IntegrityError:
+                raise falcon.HTTPBadRequest("Email already exists")
+            # Create an empty profile, to be populated later
+            c.execute("INSERT INTO [profile] ([user_id]) VALUES (?)", (new_id,))
+            # For now, all new users auto-join the two campaigns until campaign support is added
+            c.execute("""
+            INSERT INTO [user_campaign_map] ([user_id], [campaign_id]) 
+            VALUES (?, ?), (?, ?)""", (new_id, 1, new_id, campaign_id))
         logging.info("Created new user with email [{}]".format(user['email']))
-        # Create an empty profile, to be populated later
-        c.execute("INSERT INTO [profile] ([user_id]) VALUES (?)", (new_id,))
-        # For now, all new users auto-join the two campaigns until campaign support is added
-        c.execute("""
-        INSERT INTO [user_campaign_map] ([user_id], [campaign_id]) 
-        VALUES (?, ?), (?, ?)""", (new_id, 1, new_id, campaign_id))
-        self._db.commit()
         res.status = falcon.HTTP_CREATED
 
     def get_user_campaigns(self, id) -> dict:
-        c = self._db.cursor()
+        c = self._read_db.cursor()
         rows = c.execute("""
                 SELECT [id], [name] FROM [campaign] 
                 JOIN user_campaign_map ucm on campaign.id = ucm.campaign_id
@@ -84,32 +93,44 @@ class UsersResource(Resource):
         }, JWT_KEY)
 
     def authenticate(self, email: str, password: str) -> bytes:
-        c = self._db.cursor()
+        c = self._read_db.cursor()
         row = c.execute("SELECT [id], [password], [alias], [active] FROM [user] WHERE [email] = ?", [email]).fetchone()
         if row is None:
             raise falcon.HTTPUnauthorized("Invalid email or password")
         if not int(row[3]):
             raise falcon.HTTPUnauthorized("User is inactive")
-        if not bcrypt.checkpw(password.encode(), row[1]):
+        if not self._passwords.check(password, row[1]):
             raise falcon.HTTPUnauthorized("Invalid email or password")
         id = row[0]
         alias = row[2]
         return self.get_jwt(id, email, alias)
 
     def validate_claims(self, claims):
-        c = self._db.cursor()
+        key = (claims["id"], claims["email"], claims["selected_campaign"])
+        # Only successful validations are cached, so an unauthorized token is always re-checked against the db
+        if self._claims_cache.get(key):
+            return {
+                'id': claims['id'],
+                'email': claims['email'],
+                'alias': claims['alias'],
+                'campaign': claims['selected_campaign']
+            }
+        c = self._read_db.cursor()
         try:
             result = c.execute("""SELECT [id], [alias], [active] FROM [user] WHERE [id] = ? AND [email] = ?""",
                                (claims["id"], claims["email"])).fetchone()
         except sqlite3.Error:
             # Unauthorized/invalid or unable to authorize at this time
             return None
+        if result is None:
+            return None
         id, alias, active = result
         if not active:
             return None
         campaigns = self.get_user_campaigns(id)
         if claims['selected_campaign'] not in campaigns.keys():
             return None
+        self._claims_cache.put(key, True)
         return {
             'id': id,
             'email': claims['email'],
@@ -129,22 +150,32 @@ class Captcha(Resource):
 
     length = 12
 
+    def __init__(self, db: Database, data_path: str, captcha_store: CaptchaStore = None):
+        super().__init__(db, data_path)
+        self._captchas = captcha_store if captcha_store is not None else SqliteCaptchaStore(db)
+
     @staticmethod
     def _overwrite_merge(a: list, b, idx: int):
         for i, char in enumerate(b):
             a[idx + i] = char
 
-    def _try_random_letter(self, i: int, chars: list):
-        letter = choice(ascii_lowercase)
+    def _forms_word(self, i: int, chars: list, letter: str) -> bool:
+        """ Whether letter at position i would spell out a word with the letters around it """
         if i > 1 and chars[i - 2] + chars[i - 1] + letter in self.words:
-            return self._try_random_letter(i, chars)
+            return True
         if 0 < i < len(chars)-1:
             if chars[i + 1] and chars[i - 1] + letter + chars[i + 1] in self.words:
-                return self._try_random_letter(i, chars)
+                return True
         if i < len(chars) - 2:
             if chars[i + 1] and chars[i + 2] and letter + chars[i + 1] + chars[i + 2] in self.words:
-                return self._try_random_letter(i, chars)
-        chars[i] = letter
+                return True
+        return False
+
+    def _try_random_letter(self, i: int, chars: list):
+        # Each letter is tried at most once, in a random order. No word has a q, so it is always a safe fallback
+        letters = (letter for letter in sample(ascii_lowercase, len(ascii_lowercase))
+                   if not self._forms_word(i, chars, letter))
+        chars[i] = next(letters, "q")
 
     def on_post(self, req: falcon.Request, res: falcon.Response):
         id = generate_new_id()
@@ -159,10 +190,7 @@ class Captcha(Resource):
         for i, each in enumerate(chars):
             if not each:
                 self._try_random_letter(i, chars)
-        c = self._db.cursor()
-        c.execute("INSERT INTO [captcha_tokens] ([id], [answer], [time]) VALUES (?, ?, ?)",
-                  (id, first+second, time.time()))
-        self._db.commit()
+        self._captchas.put(id, first+second)
         res.media = {
             "id": id,
             "question": "".join(chars)
@@ -185,7 +213,7 @@ class Login(UsersResource):
 class Profile(UsersResource):
 
     def on_get(self, req: falcon.Request, res: falcon.Response, profile_id: str):
-        c = self._db.cursor()
+        c = self._read_db.cursor()
         sql_res = c.execute("SELECT [image], [timezone], [status] FROM [profile] WHERE user_id = ?", (profile_id,))
         row = sql_res.fetchone()
         if row is None:
@@ -202,10 +230,11 @@ class Profile(UsersResource):
         if not req.media:
             raise falcon.HTTPBadRequest("Bad or missing profile payload")
         profile = req.media
-        c = self._db.cursor()
-        c.execute("UPDATE [profile] SET [status]=?, [timezone]=?, [image]=? WHERE user_id = ?",
-                  (profile['status'], profile['timezone'], profile.get('image', None), req.context['user']['id']))
-        self._db.commit()
+        with self.transaction() as db:
+            db.execute("UPDATE [profile] SET [status]=?, [timezone]=?, [image]=? WHERE user_id = ?",
+                       (profile['status'], profile['timezone'], profile.get('image', None), req.context['user']['id']))
+        # The user's claims are re-validated on their next request, rather than trusted for the rest of the cache's ttl
+        self._claims_cache.invalidate_user(req.context['user']['id'])
         logging.info("Updated profile for user {}".format(req.context['user']['id']))
         res.media = profile
         res.status = falcon.HTTP_OK
@@ -213,6 +242,8 @@ class Profile(UsersResource):
     def on_post(self, req: falcon.Request, res: falcon.Response, campaign_id):
         """ Switch campaigns """
         user = req.context['user']
+        # Campaign membership is re-read for the new token, so drop any claims cached for the old membership
+        self._claims_cache.invalidate_user(user['id'])
         res.media = {
             "jwt": self.get_jwt(user['id'], user['email'], user['alias'], int(campaign_id)).decode()
         }
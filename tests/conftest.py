@@ -0,0 +1,35 @@
+from src.lore_log import API
+from src.lore_log.db import Database
+from tests.support import migrate, seed
+from falcon import testing
+import pytest
+
+
+@pytest.fixture
+def db(tmp_path) -> Database:
+    db = Database(str(tmp_path / "db.sqlite"))
+    migrate(db)
+    seed(db)
+    return db
+
+
+@pytest.fixture
+def client(db, tmp_path) -> testing.TestClient:
+    return testing.TestClient(API(db, str(tmp_path), bcrypt_rounds=4))
+
+
+def login(client: testing.TestClient, email: str) -> dict:
+    jwt = client.simulate_post("/login", json={"email": email, "password": "password"}).json["jwt"]
+    return {"Authorization": "jwt " + jwt}
+
+
+@pytest.fixture
+def headers(client) -> dict:
+    """ Of u1, the master of campaigns 1 and 2 """
+    return login(client, "one@example.com")
+
+
+@pytest.fixture
+def headers2(client) -> dict:
+    """ Of u2, a player in campaign 1 """
+    return login(client, "two@example.com")
@@ -0,0 +1,29 @@
+""" Shared set up for the tests and for bench.query_plans """
+from src.lore_log.db import Database, OrderedMigration
+from contextlib import redirect_stdout
+import bcrypt
+import io
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+MIGRATION_DIR = os.path.join(ROOT, "db", "sqlite", "migrations")
+
+
+def migrate(db: Database):
+    # Migrations report progress on stdout
+    with redirect_stdout(io.StringIO()):
+        OrderedMigration(MIGRATION_DIR, db.connection())()
+
+
+def seed(db: Database):
+    """ Two users of campaign 1, of which u1 is the master, and u1 as the master of campaign 2 """
+    conn = db.connection()
+    for id, email in (("u1", "one@example.com"), ("u2", "two@example.com")):
+        conn.execute("INSERT INTO [user] ([id], [email], [password], [alias]) VALUES (?, ?, ?, ?)",
+                     (id, email, bcrypt.hashpw(b"password", bcrypt.gensalt(4)), id))
+        conn.execute("INSERT INTO [profile] ([user_id]) VALUES (?)", (id,))
+        conn.execute("INSERT INTO [user_campaign_map] ([user_id], [campaign_id], [is_master]) VALUES (?, 1, ?)",
+                     (id, int(id == "u1")))
+    conn.execute("INSERT INTO [user_campaign_map] ([user_id], [campaign_id], [is_master]) VALUES ('u1', 2, 1)")
+    conn.execute("INSERT INTO [campaign_referral] ([code], [campaign_id]) VALUES ('referral', 2)")
+    conn.commit()
@@ -0,0 +1,25 @@
+import pytest
+
+
+def thing(name: str, values: dict = None) -> dict:
+    return dict({"name": name, "type": "gem", "is_public": 1, "rich_description": "Shiny"}, **(values or {}))
+
+
+def test_bulk_create(client, headers):
+    result = client.simulate_post("/things", json=[thing("Ruby"), thing("Opal")], headers=headers)
+    assert result.status_code == 201
+    assert [each["status"] for each in result.json] == [201, 201]
+
+
+@pytest.mark.parametrize("values", [
+    {"name": {"a": 1}},
+    {"type": [1]},
+    {"is_public": [1]},
+    {"rich_description": {"p": "Shiny"}},
+    {"rich_description": 5},
+])
+def test_bulk_create_bad_value(client, headers, values):
+    result = client.simulate_post("/things", json=[thing("Ruby"), thing("Opal", values)], headers=headers)
+    assert result.status_code == 207
+    assert [each["status"] for each in result.json] == [201, 400]
+    assert [each["name"] for each in client.simulate_get("/things", headers=headers).json] == ["Ruby"]
@@ -0,0 +1,95 @@
+import json
+import pytest
+
+
+@pytest.fixture
+def snapshot(client, headers) -> list:
+    """ The exported lines of campaign 1, holding a character owning a thing, in a faction and with an entry """
+    def post(path, body):
+        result = client.simulate_post(path, json=body, headers=headers)
+        assert result.status_code == 201, result.text
+        return result.json
+
+    character = post("/characters", {"name": "Aldric", "race": "human", "level": 3, "attributes_public": 1,
+                                     "is_public": 1, "is_pc": 1})
+    faction = post("/factions", {"name": "Harpers", "is_public": 1, "rich_description": "A secret network"})
+    post("/things", {"name": "Sword", "type": "weapon", "is_public": 1, "owner_id": character["id"],
+                     "rich_description": "Sharp"})
+    post(f"/characters/{character['id']}/relations/factions", {"relation_id": faction["id"], "is_public": 1})
+    post("/chronicle", {"title": "Arrival", "relation_type": "character", "relation_id": character["id"],
+                        "is_public": 1, "rich_description": "Aldric arrives"})
+    result = client.simulate_get("/campaigns/1/export", headers=headers)
+    assert result.status_code == 200
+    return [json.loads(line) for line in result.text.splitlines()]
+
+
+def post_import(client, headers, lines) -> object:
+    body = "\n".join(each if isinstance(each, str) else json.dumps(each) for each in lines)
+    return client.simulate_post("/campaigns/2/import", body=body, headers=headers)
+
+
+def replace(snapshot: list, table: str, **changes) -> list:
+    """ The snapshot with `changes` made to the row of the first line of `table`, or that row replaced by `row` """
+    lines = [dict(each) for each in snapshot]
+    line = next(each for each in lines if each["table"] == table)
+    line["row"] = changes["row"] if "row" in changes else dict(line["row"], **changes)
+    return lines
+
+
+def test_import_snapshot(client, headers, snapshot):
+    result = post_import(client, headers, snapshot)
+    assert result.status_code == 201, result.text
+    assert result.json == {"character": 1, "faction": 1, "thing": 1, "chronicle_entry": 1, "character_faction": 1,
+                           "entity_chronicle": 1}
+
+
+def test_import_truncated_line(client, headers, snapshot):
+    lines = [json.dumps(each) for each in snapshot]
+    lines[1] = lines[1][:len(lines[1]) // 2]
+    result = post_import(client, headers, lines)
+    assert result.status_code == 400
+    assert "line 2" in result.json["title"]
+
+
+@pytest.mark.parametrize("row", [[], "character", 1, None])
+def test_import_row_not_an_object(client, headers, snapshot, row):
+    result = post_import(client, headers, replace(snapshot, "character", row=row))
+    assert result.status_code == 400
+
+
+@pytest.mark.parametrize("value", [[1], {"a": 1}])
+def test_import_value_not_scalar(client, headers, snapshot, value):
+    result = post_import(client, headers, replace(snapshot, "character", level=value))
+    assert result.status_code == 400
+
+
+def test_import_entity_without_id(client, headers, snapshot):
+    lines = replace(snapshot, "faction")
+    del next(each for each in lines if each["table"] == "faction")["row"]["id"]
+    result = post_import(client, headers, lines)
+    assert result.status_code == 400
+    assert "missing id" in result.json["title"]
+
+
+def test_import_link_without_entry(client, headers, snapshot):
+    lines = replace(snapshot, "entity_chronicle")
+    del next(each for each in lines if each["table"] == "entity_chronicle")["row"]["chronicle_entry_id"]
+    result = post_import(client, headers, lines)
+    assert result.status_code == 400
+    assert "chronicle_entry_id" in result.json["title"]
+
+
+@pytest.mark.parametrize("table, changes", [
+    ("thing", {"owner_id": 999}),
+    ("character_faction", {"faction_id": 999}),
+])
+def test_import_dangling_reference(client, headers, snapshot, table, changes):
+    result = post_import(client, headers, replace(snapshot, table, **changes))
+    assert result.status_code == 400
+    assert "not a" in result.json["title"]
+
+
+def test_import_rejected_is_rolled_back(client, headers, snapshot, db):
+    result = post_import(client, headers, replace(snapshot, "character", name=None))
+    assert result.status_code == 400
+    assert db.connection().execute("SELECT count(*) FROM [character] WHERE [campaign_id] = 2").fetchone()[0] == 0
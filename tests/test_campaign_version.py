@@ -0,0 +1,22 @@
+def version(db, campaign_id: int) -> int:
+    return db.connection().execute("SELECT [version] FROM [campaign] WHERE [id] = ?", (campaign_id,)).fetchone()[0]
+
+
+def test_update_bumps_the_rows_campaign(client, db, headers):
+    faction = client.simulate_post("/factions", json={"name": "Harpers", "is_public": 1, "rich_description": "x"},
+                                   headers=headers).json
+    # Edited by its creator while they have campaign 2 selected
+    switched = {"Authorization": "jwt " + client.simulate_post("/profile/campaigns/2", headers=headers).json["jwt"]}
+    before = version(db, 1)
+    result = client.simulate_patch(f"/factions/{faction['id']}", json=dict(faction, name="Zhentarim"),
+                                   headers=switched)
+    assert result.status_code == 200
+    assert version(db, 1) > before
+
+
+def test_update_invalidates_cached_collection(client, headers):
+    faction = client.simulate_post("/factions", json={"name": "Harpers", "is_public": 1, "rich_description": "x"},
+                                   headers=headers).json
+    assert client.simulate_get("/factions", headers=headers).json[0]["name"] == "Harpers"
+    client.simulate_patch(f"/factions/{faction['id']}", json=dict(faction, name="Zhentarim"), headers=headers)
+    assert client.simulate_get("/factions", headers=headers).json[0]["name"] == "Zhentarim"
@@ -0,0 +1,73 @@
+import pytest
+
+
+@pytest.fixture
+def post(client):
+    def post(path, body, headers):
+        result = client.simulate_post(path, json=body, headers=headers)
+        assert result.status_code == 201, result.text
+        return result.json
+    return post
+
+
+def character(post, headers) -> dict:
+    return post("/characters", {"name": "Aldric", "race": "human", "level": 3, "attributes_public": 1, "is_public": 1,
+                                "is_pc": 1}, headers)
+
+
+def faction(post, headers) -> dict:
+    return post("/factions", {"name": "Harpers", "is_public": 1, "rich_description": "A secret network"}, headers)
+
+
+def changes(client, headers, since: int) -> dict:
+    result = client.simulate_get(f"/changes?since={since}", headers=headers)
+    assert result.status_code == 200
+    return result.json
+
+
+def version(client, headers) -> int:
+    return changes(client, headers, 0)["version"]
+
+
+def deleted_memberships(client, headers, since: int) -> list:
+    return [each["key"] for each in changes(client, headers, since)["deleted"] if each["table"] == "character_faction"]
+
+
+def test_private_membership_delete(client, post, headers, headers2):
+    member, group = character(post, headers), faction(post, headers)
+    post(f"/characters/{member['id']}/relations/factions", {"relation_id": group["id"], "is_public": 0}, headers)
+    # Only the user who created both sides sees the membership
+    assert len(changes(client, headers, 0)["changes"]["character_faction"]) == 1
+    assert changes(client, headers2, 0)["changes"]["character_faction"] == []
+    since = version(client, headers)
+    result = client.simulate_delete(f"/characters/{member['id']}/relations/factions/{group['id']}", headers=headers)
+    assert result.status_code == 204
+    assert deleted_memberships(client, headers, since) == [{"character_id": str(member["id"]),
+                                                            "faction_id": group["id"]}]
+    assert deleted_memberships(client, headers2, since) == []
+
+
+def test_private_membership_seen_by_no_one(client, post, headers, headers2):
+    # u2 puts their character in u1's faction, which neither of them can see while it is private
+    member, group = character(post, headers2), faction(post, headers)
+    post(f"/characters/{member['id']}/relations/factions", {"relation_id": group["id"], "is_public": 0}, headers2)
+    assert changes(client, headers, 0)["changes"]["character_faction"] == []
+    assert changes(client, headers2, 0)["changes"]["character_faction"] == []
+    since = version(client, headers)
+    result = client.simulate_delete(f"/characters/{member['id']}/relations/factions/{group['id']}", headers=headers2)
+    assert result.status_code == 204
+    assert deleted_memberships(client, headers, since) == []
+    assert deleted_memberships(client, headers2, since) == []
+
+
+def test_legacy_membership_delete(client, db, post, headers, headers2):
+    member, group = character(post, headers), faction(post, headers)
+    conn = db.connection()
+    conn.execute("INSERT INTO [character_faction] ([character_id], [faction_id], [is_public]) VALUES (?, ?, 0)",
+                 (member["id"], group["id"]))
+    conn.commit()
+    since = version(client, headers)
+    conn.execute("DELETE FROM [character_faction] WHERE [character_id] = ?", (member["id"],))
+    conn.commit()
+    assert len(deleted_memberships(client, headers, since)) == 1
+    assert deleted_memberships(client, headers2, since) == []
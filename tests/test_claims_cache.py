@@ -0,0 +1,21 @@
+def cached(client, user_id: str, campaign_id: int) -> bool:
+    return client.app.claims_cache.get((user_id, "one@example.com", campaign_id)) is not None
+
+
+def test_claims_are_cached(client, headers):
+    assert client.simulate_get("/characters", headers=headers).status_code == 200
+    assert cached(client, "u1", 1)
+
+
+def test_profile_update_drops_claims(client, headers):
+    client.simulate_get("/characters", headers=headers)
+    result = client.simulate_patch("/profile", json={"status": "away", "timezone": "UTC"}, headers=headers)
+    assert result.status_code == 200
+    assert not cached(client, "u1", 1)
+
+
+def test_campaign_switch_drops_claims(client, headers):
+    client.simulate_get("/characters", headers=headers)
+    result = client.simulate_post("/profile/campaigns/2", headers=headers)
+    assert result.status_code == 200
+    assert not cached(client, "u1", 1)
@@ -0,0 +1,156 @@
+""" Query plan regression test.
+
+Drives every API route against a freshly migrated database, records each SQL statement the resources issue, and runs
+EXPLAIN QUERY PLAN on it. Fails if any statement reads a table with a full scan instead of an index, which is what a
+migration that drops or changes an index the visibility and paging predicates rely on looks like. bench.query_plans
+runs the same check from the command line.
+"""
+from src.lore_log import API
+from src.lore_log.db import Database
+from tests.support import migrate, seed
+from falcon import testing
+import sqlite3
+import os
+import re
+
+# Internal tables that are only read by migrations
+ALLOWED_SCANS = {"__nimbus__mig_", "sqlite_master", "sqlite_sequence"}
+# The names of common table expressions, e.g. `walk` in `WITH RECURSIVE walk([id], [depth]) AS (`. Recursive ones are
+# read back one row at a time as a queue, so always show as a scan
+CTE_NAMES = re.compile(r"(\w+)\s*(?:\([^()]*\))?\s+AS\s+\(", re.IGNORECASE)
+
+
+class TracingDatabase(Database):
+    """ A Database that records every statement run on any of its connections """
+
+    def __init__(self, path: str):
+        self.statements = []
+        super().__init__(path)
+
+    def _traced(self, conn: sqlite3.Connection) -> sqlite3.Connection:
+        conn.set_trace_callback(self.statements.append)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        return self._traced(super().connection())
+
+    def read_connection(self) -> sqlite3.Connection:
+        return self._traced(super().read_connection())
+
+
+def drive(client: testing.TestClient):
+    """ Calls every route at least once, with each of the query params that changes the sql """
+    jwt = client.simulate_post("/login", json={"email": "one@example.com", "password": "password"}).json["jwt"]
+    headers = {"Authorization": "jwt " + jwt}
+
+    def call(method, path, **kwargs):
+        result = getattr(client, "simulate_" + method)(path, headers=headers, **kwargs)
+        if result.status_code >= 400:
+            raise RuntimeError(f"{method.upper()} {path} failed with {result.status}: {result.text}")
+        return result
+
+    for name in ("Aldric", "Brienne"):
+        call("post", "/characters", json={"name": name, "race": "human", "level": 3, "attributes_public": 1,
+                                          "is_public": 1, "is_pc": 1})
+        call("post", "/factions", json={"name": name + "'s Harpers", "is_public": 1,
+                                        "rich_description": "A secret network"})
+        call("post", "/places", json={"name": name + "'s Keep", "type": "city", "is_public": 1,
+                                      "rich_description": "A fortified city"})
+        call("post", "/things", json={"name": name + "'s Sword", "type": "weapon", "is_public": 1, "owner_id": 1,
+                                      "rich_description": "Sharp"})
+    call("post", "/chronicle", json={"title": "Arrival", "relation_type": "character", "relation_id": 1,
+                                     "is_public": 1, "rich_description": "They arrived"})
+    call("post", "/chronicle", json={"title": "Departure", "relation_type": "faction", "relation_id": 1,
+                                     "is_public": 1, "rich_description": "They left", "tick": 5000})
+    call("post", "/things", json=[{"name": name + "'s Shield", "type": "armour", "is_public": 1,
+                                   "rich_description": "Sturdy"} for name in ("Aldric", "Brienne")])
+    call("post", "/characters/1/relations/factions", json={"relation_id": 1, "is_public": 1, "role": "agent"})
+
+    for path in ("/characters", "/factions", "/places", "/things", "/chronicle"):
+        cursor = call("get", path + "?limit=1").headers["x-next-cursor"]
+        call("get", f"{path}?limit=1&cursor={cursor}")
+    call("get", "/places?type=city")
+    for path in ("/characters", "/factions", "/places", "/things", "/chronicle"):
+        call("get", path + "?fields=id&limit=1")
+    call("get", "/search?q=harpers&type=faction&type=thing")
+    for relation_type in ("character", "faction", "place", "thing"):
+        call("get", f"/chronicle?relation_type={relation_type}&relation_id=1")
+        call("get", f"/chronicle?relation_type={relation_type}")
+    timeline = "/chronicle?relation_type=character&relation_id=1&include=factions&from_tick=0&to_tick=10000&limit=1"
+    cursor = call("get", timeline).headers["x-next-cursor"]
+    call("get", f"{timeline}&cursor={cursor}")
+    call("get", "/chronicle?from_tick=0&to_tick=10000&fields=id,relation_id")
+    entry_id = call("get", "/chronicle").json[0]["id"]
+    call("get", "/chronicle/" + entry_id)
+    call("patch", "/chronicle/" + entry_id, json={"id": entry_id, "title": "Arrival!", "tick": 1000,
+                                                  "relation_type": "character", "is_public": 1,
+                                                  "rich_description": "They arrived, loudly"})
+    for path in ("/characters/1", "/factions/1", "/places/1", "/things/1"):
+        call("get", path)
+    call("patch", "/factions/1", json={"id": 1, "name": "The Harpers", "is_public": 1, "rich_description": "Shh"})
+    call("get", "/characters/1/relations/factions")
+    call("get", "/factions/1/relations/characters")
+    for root in ("character:1", "faction:1", "place:1", "thing:1"):
+        call("get", f"/graph?root={root}&depth=4")
+    snapshot = call("get", "/campaigns/1/export").text
+    call("post", "/campaigns/2/import", body=snapshot)
+    call("delete", "/characters/1/relations/factions/1")
+    version = call("get", "/changes?since=0&limit=5").json["version"]
+    call("get", f"/changes?since={version}")
+    call("get", "/profile/u1")
+    call("patch", "/profile", json={"status": "busy", "timezone": "UTC"})
+    call("post", "/profile/campaigns/1")
+    call("get", "/metrics")
+
+    captcha = client.simulate_post("/captcha").json
+    return captcha
+
+
+def full_scans(conn: sqlite3.Connection, sql: str) -> list:
+    try:
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    except sqlite3.ProgrammingError:
+        # Older sqlite versions trace statements without their bound parameters
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, [None] * sql.count("?")).fetchall()
+    ctes = set(CTE_NAMES.findall(sql)) if sql.upper().startswith("WITH") else set()
+    scans = []
+    for _, _, _, detail in plan:
+        if not detail.startswith("SCAN ") or " USING " in detail or " VIRTUAL TABLE " in detail:
+            continue
+        table = detail.split()[1]
+        if table in ALLOWED_SCANS or table in ctes or table in ("CONSTANT", "subquery") or table.startswith("("):
+            continue
+        scans.append(detail)
+    return scans
+
+
+def planned_statements(path: str) -> tuple:
+    """ Every distinct statement the API ran against a database in `path`, and a connection to explain them on """
+    db = TracingDatabase(os.path.join(path, "db.sqlite"))
+    migrate(db)
+    seed(db)
+    db.statements.clear()
+
+    client = testing.TestClient(API(db, path))
+    captcha = drive(client)
+    answer = db.connection().execute("SELECT [answer] FROM [captcha_tokens] WHERE [id] = ?",
+                                     (captcha["id"],)).fetchone()[0]
+    client.simulate_post("/users", json={"email": "three@example.com", "alias": "u3", "password": "password",
+                                         "code": "referral", "captcha": {"id": captcha["id"], "answer": answer}})
+
+    statements = []
+    for sql in db.statements:
+        sql = sql.strip()
+        # fts5 reads and writes its own shadow tables with statements qualified by schema name
+        internal = "'main'." in sql
+        if sql.split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE", "WITH") and not internal \
+                and sql not in statements:
+            statements.append(sql)
+    return statements, db.connection()
+
+
+def test_no_full_scans(tmp_path):
+    statements, conn = planned_statements(str(tmp_path))
+    failures = ["{}:\n    {}".format("; ".join(scans), " ".join(sql.split()))
+                for sql, scans in ((sql, full_scans(conn, sql)) for sql in statements) if scans]
+    assert not failures, "full table scans in:\n" + "\n".join(failures)
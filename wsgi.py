@@ -1,13 +1,35 @@
 from src.lore_log import API
-from migrate import Migration
-import sqlite3
+from src.lore_log.db import Database, OrderedMigration
+from src.lore_log.fts import index_missing
+from src.lore_log.search import searchable_models
+from src.lore_log.captcha import MemoryCaptchaStore
+from src.lore_log.profiling import SqlProfiler
 import os
 
 data_dir = os.environ["LL_API_DATA"]
 migration_dir = os.environ["LL_API_MIGRATION_DIR"]
 
-sql_conn = sqlite3.connect(os.path.join(data_dir, "db.sqlite"))
-migration = Migration(migration_dir, sql_conn)
+# Commits the writes of concurrent requests together, waiting up to this many milliseconds for others to join
+group_commit_ms = os.environ.get("LL_API_GROUP_COMMIT_MS")
+
+db = Database(os.path.join(data_dir, "db.sqlite"),
+              group_commit_window=float(group_commit_ms) / 1000 if group_commit_ms else None)
+migration = OrderedMigration(migration_dir, db.connection())
 migration()
+with db.transaction() as conn:
+    index_missing(conn, data_dir, searchable_models)
+
+# Profiling keeps every statement run by recent requests, so is meant for running locally against a copy of real data
+sql_profiler = SqlProfiler(float(os.environ.get("LL_API_SLOW_QUERY_MS", 100)),
+                           int(os.environ.get("LL_API_SQL_REPEAT_THRESHOLD", 10))) \
+    if os.environ.get("LL_API_SQL_PROFILE") == "1" else None
 
-application = API(sql_conn, data_dir)
+application = API(db, data_dir,
+                  rich_description_cache_bytes=int(os.environ.get("LL_API_RICH_CACHE_BYTES", 64 * 1024 * 1024)),
+                  response_cache_bytes=int(os.environ.get("LL_API_RESPONSE_CACHE_BYTES", 16 * 1024 * 1024)),
+                  bcrypt_rounds=int(os.environ.get("LL_API_BCRYPT_ROUNDS", 12)),
+                  bcrypt_workers=int(os.environ.get("LL_API_BCRYPT_WORKERS", 2)),
+                  bcrypt_max_queue=int(os.environ.get("LL_API_BCRYPT_MAX_QUEUE", 16)),
+                  # Only for a single process, as each process would have its own captchas
+                  captcha_store=MemoryCaptchaStore() if os.environ.get("LL_API_CAPTCHA_STORE") == "memory" else None,
+                  sql_profiler=sql_profiler)